@@ -0,0 +1,9 @@
+import pytest
+
+from yatube.test_runner import local_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _local_cache():
+    with local_cache():
+        yield
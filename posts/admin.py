@@ -1,13 +1,20 @@
 from django.contrib import admin
 from .models import Post, Group, Comment
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ("pk", "text", "pub_date", "author")
+    list_display = ("pk", "text", "pub_date", "author", "comment_count")
     search_fields = ("text",)
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        matched = search_posts(search_term).order_by().values("pk")
+        return queryset.filter(pk__in=matched), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     pass
@@ -0,0 +1,177 @@
+"""JSON API только для чтения.
+
+Списки листаются курсором, поле ``fields`` сужает набор полей. Ответ
+кэшируется под ключом из версий областей кэша лент (см. feed_cache),
+а ETag строится из того же ключа, поэтому If-None-Match отвечается
+без обращения к таблицам записей.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from . import feed_cache
+from .models import Comment, Group, Post, User
+from .paginators import POSTS_PER_PAGE, CursorPaginator
+from .timeline import Timeline, TimelineCursorPaginator
+
+API_CACHE_TIMEOUT = getattr(settings, "API_CACHE_TIMEOUT", 60 * 60)
+
+POST_FIELDS = {
+    "id": lambda post: post.pk,
+    "text": lambda post: post.text,
+    "author": lambda post: post.author.username,
+    "group": lambda post: post.group.slug if post.group_id else None,
+    "pub_date": lambda post: post.pub_date.isoformat(),
+    "image": lambda post: post.image.url if post.image else None,
+    "comments": lambda post: post.comment_count,
+}
+# Комментарии не меняют области лент подписок (см.
+# feed_cache.invalidate_post), поэтому ETag ленты подписок не следит за
+# счётчиком комментариев, и в её ответе этого поля нет.
+FOLLOW_POST_FIELDS = {name: getter for name, getter in POST_FIELDS.items()
+                      if name != "comments"}
+COMMENT_FIELDS = {
+    "id": lambda comment: comment.pk,
+    "post": lambda comment: comment.post_id,
+    "author": lambda comment: comment.author.username,
+    "text": lambda comment: comment.text,
+    "created": lambda comment: comment.created.isoformat(),
+}
+GROUP_FIELDS = {
+    "slug": lambda group: group.slug,
+    "title": lambda group: group.title,
+    "description": lambda group: group.description,
+}
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def _selected_fields(request, available):
+    requested = request.GET.get("fields")
+    if not requested:
+        return available
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldsError(f"Неизвестные поля: {', '.join(unknown)}")
+    return {name: available[name] for name in names}
+
+
+def _serialize(obj, fields):
+    return {name: getter(obj) for name, getter in fields.items()}
+
+
+def _cursor_list(request, queryset, fields, date_field="pub_date",
+                 paginator_class=CursorPaginator):
+    paginator = paginator_class(queryset, POSTS_PER_PAGE, date_field)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return {"results": [_serialize(obj, fields) for obj in page],
+            "next": page.next_cursor,
+            "previous": page.previous_cursor}
+
+
+def _etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH", "")
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def cached_json(request, scopes, build):
+    """Отдаёт JSON из кэша или строит его, поддерживая ETag."""
+    versions = feed_cache.get_versions(feed_cache.GLOBAL, *scopes)
+    raw_key = ":".join(list(scopes) + versions + [request.get_full_path()])
+    digest = hashlib.md5(raw_key.encode()).hexdigest()
+    etag = f'"{digest}"'
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    key = f"api:{digest}"
+    body = cache.get(key)
+    if body is None:
+        try:
+            data = build()
+        except FieldsError as error:
+            return JsonResponse({"detail": str(error)}, status=400)
+        body = json.dumps(data, ensure_ascii=False)
+        cache.set(key, body, API_CACHE_TIMEOUT)
+    response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@require_GET
+def post_list(request):
+    return cached_json(request, [feed_cache.INDEX], lambda: _cursor_list(
+        request, Post.objects.for_cards(),
+        _selected_fields(request, POST_FIELDS)))
+
+
+@require_GET
+def post_detail(request, post_id):
+    # Область записи меняется при её правке, удалении и комментариях,
+    # поэтому свежесть проверяется до запроса к Post.
+    return cached_json(
+        request, [feed_cache.post_scope(post_id)],
+        lambda: _serialize(get_object_or_404(Post.objects.for_cards(),
+                                             pk=post_id),
+                           _selected_fields(request, POST_FIELDS)))
+
+
+@require_GET
+def comment_list(request, post_id):
+    def build():
+        get_object_or_404(Post.objects.only("id"), pk=post_id)
+        comments = Comment.objects.filter(post_id=post_id).select_related(
+            "author")
+        return _cursor_list(request, comments,
+                            _selected_fields(request, COMMENT_FIELDS),
+                            date_field="created")
+    return cached_json(request, [feed_cache.post_scope(post_id)], build)
+
+
+@require_GET
+def group_list(request):
+    def build():
+        fields = _selected_fields(request, GROUP_FIELDS)
+        return {"results": [_serialize(group, fields)
+                            for group in Group.objects.order_by("slug")]}
+    return cached_json(request, [], build)
+
+
+@require_GET
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return cached_json(
+        request, [feed_cache.group_scope(group.pk)],
+        lambda: _cursor_list(request, group.posts.for_cards(),
+                             _selected_fields(request, POST_FIELDS)))
+
+
+@require_GET
+def profile_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return cached_json(
+        request, [feed_cache.profile_scope(author.pk)],
+        lambda: _cursor_list(request, author.posts.for_cards(),
+                             _selected_fields(request, POST_FIELDS)))
+
+
+@require_GET
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "Требуется авторизация"}, status=401)
+    post_list = Timeline(request.user)
+    return cached_json(
+        request, feed_cache.follow_scopes(request.user, post_list.author_ids),
+        lambda: _cursor_list(request, post_list,
+                             _selected_fields(request, FOLLOW_POST_FIELDS),
+                             paginator_class=TimelineCursorPaginator))
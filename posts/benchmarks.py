@@ -0,0 +1,117 @@
+"""Нагрузочный прогон страниц через WSGI-приложение в том же процессе.
+
+Запросы идут в настоящий WSGIHandler (все middleware, сессии, шаблоны)
+из нескольких потоков, как у многопоточного воркера, но без сети.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY
+from django.contrib.auth import SESSION_KEY
+from django.core.wsgi import get_wsgi_application
+
+from .models import Comment, Follow, Post, User, UserStats
+
+HOST = "localhost"
+
+
+def login_cookie(user):
+    """Cookie сессии вошедшего пользователя, как после входа."""
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+
+def _environ(url, cookie):
+    parts = urlsplit(url)
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": parts.path,
+        "QUERY_STRING": parts.query, "SERVER_NAME": HOST,
+        "SERVER_PORT": "80", "HTTP_HOST": HOST, "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0), "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(), "wsgi.errors": BytesIO(),
+        "wsgi.multithread": True, "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if cookie:
+        environ["HTTP_COOKIE"] = cookie
+    return environ
+
+
+def default_urls():
+    """Самые тяжёлые страницы базы: активный автор, обсуждаемая запись."""
+    post = Post.objects.order_by("-pub_date").first()
+    if post is None:
+        return {}
+    author = User.objects.filter(pk=UserStats.objects.order_by(
+        "-posts").values("user")[:1]).first() or post.author
+    discussed = Post.objects.order_by("-comment_count").select_related(
+        "author").first()
+    urls = {"index": "/", "trending": "/trending/",
+            "profile": f"/{author.username}/",
+            "post": f"/{discussed.author.username}/{discussed.pk}/"}
+    grouped = Post.objects.filter(group__isnull=False).order_by(
+        "-pub_date").select_related("group").first()
+    if grouped is not None:
+        urls["group_posts"] = f"/group/{grouped.group.slug}/"
+    urls["follow_index"] = "/follow/"
+    return urls
+
+
+def busiest_follower():
+    """Читатель с наибольшим числом подписок."""
+    stats = UserStats.objects.order_by("-following").select_related(
+        "user").first()
+    return stats.user if stats else User.objects.first()
+
+
+def data_sizes():
+    """Объём данных, с которым сделан прогон: для сравнения в отчёте."""
+    return {"users": User.objects.count(), "posts": Post.objects.count(),
+            "comments": Comment.objects.count(),
+            "follows": Follow.objects.count()}
+
+
+def percentile(durations, fraction):
+    ordered = sorted(durations)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class ViewBenchmark:
+    def __init__(self):
+        self.application = get_wsgi_application()
+
+    def request(self, url, cookie=None):
+        statuses = []
+        started = time.perf_counter()
+        body = self.application(_environ(url, cookie),
+                                lambda status, headers: statuses.append(
+                                    status))
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        return time.perf_counter() - started, statuses[0]
+
+    def run(self, url, requests, concurrency, cookie=None):
+        """Возвращает (запросов в секунду, список длительностей, ошибки)."""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: self.request(url, cookie),
+                                    range(requests)))
+        elapsed = time.perf_counter() - started
+        errors = sum(1 for _, status in results
+                     if not status.startswith("200"))
+        return (requests / elapsed, [duration for duration, _ in results],
+                errors)
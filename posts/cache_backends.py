@@ -0,0 +1,239 @@
+"""Кэш в файле SQLite, общий для всех процессов одного сервера.
+
+LocMemCache у каждого воркера gunicorn свой: фрагменты лент копируются
+по процессам, а смена версии области (см. feed_cache) не доходит до
+соседей. Этот бэкенд хранит записи в одном файле SQLite в режиме WAL:
+читатели не блокируют писателя, incr() и add() атомарны между
+процессами, а при переполнении вытесняются давно не читанные записи.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Не больше переменных в одном запросе, чем позволяют старые SQLite.
+BATCH_SIZE = 500
+# Время чтения обновляется не чаще раза в столько секунд, чтобы get()
+# почти всегда оставался чистым чтением.
+ACCESS_RESOLUTION = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+
+class SQLiteCache(BaseCache):
+    """Бэкенд django.core.cache поверх SQLite в режиме WAL.
+
+    Параметры OPTIONS помимо стандартных MAX_ENTRIES и CULL_FREQUENCY:
+    ``CULL_EVERY`` — как часто (в записях set) проверять размер кэша,
+    ``BUSY_TIMEOUT`` — сколько секунд ждать блокировку записи.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._cull_every = int(options.get("CULL_EVERY", 100))
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и каждого процесса после fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path,
+                                         timeout=self._busy_timeout,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _alive(expires, now):
+        return expires is None or expires > now
+
+    def _dump(self, value):
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _touch_accessed(self, connection, keys, now):
+        stale = now - ACCESS_RESOLUTION
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start:start + BATCH_SIZE]
+            connection.execute(
+                f"UPDATE cache SET accessed = ? WHERE accessed < ? "
+                f"AND key IN ({', '.join('?' * len(batch))})",
+                [now, stale, *batch])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, expires, accessed FROM cache WHERE key = ?",
+            (key,)).fetchone()
+        if row is None or not self._alive(row[1], now):
+            return default
+        if row[2] < now - ACCESS_RESOLUTION:
+            self._touch_accessed(connection, [key], now)
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        now = time.time()
+        connection = self._connection()
+        found = {}
+        stale = []
+        made_keys = list(names)
+        for start in range(0, len(made_keys), BATCH_SIZE):
+            batch = made_keys[start:start + BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT key, value, expires, accessed FROM cache "
+                f"WHERE key IN ({', '.join('?' * len(batch))})", batch)
+            for key, value, expires, accessed in rows:
+                if self._alive(expires, now):
+                    found[names[key]] = pickle.loads(value)
+                    if accessed < now - ACCESS_RESOLUTION:
+                        stale.append(key)
+        if stale:
+            self._touch_accessed(connection, stale, now)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), self._dump(value), expires, now)
+                for key, value in data.items()]
+        connection = self._connection()
+        with self._transaction(connection):
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed)"
+                " VALUES (?, ?, ?, ?)", rows)
+        self._maybe_cull(connection, len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection()
+        with self._transaction(connection):
+            row = connection.execute(
+                "SELECT expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._alive(row[0], now):
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed)"
+                " VALUES (?, ?, ?, ?)",
+                (key, self._dump(value), self.get_backend_timeout(timeout),
+                 now))
+        self._maybe_cull(connection, 1)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        made_key = self._key(key, version)
+        connection = self._connection()
+        with self._transaction(connection):
+            row = connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ?",
+                (made_key,)).fetchone()
+            if row is None or not self._alive(row[1], time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute("UPDATE cache SET value = ? WHERE key = ?",
+                               (self._dump(value), made_key))
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE cache SET expires = ?, accessed = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), now, key, now))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        cursor = self._connection().execute(
+            "DELETE FROM cache WHERE key = ?", (self._key(key, version),))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        made_keys = [(self._key(key, version),) for key in keys]
+        connection = self._connection()
+        with self._transaction(connection):
+            connection.executemany("DELETE FROM cache WHERE key = ?",
+                                   made_keys)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def _transaction(self, connection):
+        return _Immediate(connection)
+
+    def _maybe_cull(self, connection, written):
+        self._local.writes += written
+        if self._local.writes < self._cull_every:
+            return
+        self._local.writes = 0
+        self._cull(connection)
+
+    def _cull(self, connection):
+        with self._transaction(connection):
+            connection.execute("DELETE FROM cache WHERE expires <= ?",
+                               (time.time(),))
+            count = connection.execute(
+                "SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count <= self._max_entries:
+                return
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess = max(excess, count // self._cull_frequency)
+            else:
+                excess = count
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY accessed LIMIT ?)", (excess,))
+
+
+class _Immediate:
+    """BEGIN IMMEDIATE ... COMMIT: запись под блокировкой всего файла."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,130 @@
+"""Условные GET-запросы (ETag и Last-Modified) для страниц лент.
+
+Валидаторы строятся из версий областей кэша лент (см. feed_cache):
+версия хранит время своей смены, поэтому Last-Modified — это время
+последней записи или комментария в области, а проверка свежести стоит
+одного обращения к кэшу и не трогает таблицы записей. Страницы
+показывают имя и подписки вошедшего пользователя, поэтому ETag зависит
+ещё и от него, а также от его CSRF-токена: login() меняет токен, и копия
+с формой комментария и прежним токеном не должна считаться свежей.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import feed_cache
+from .models import Group, User
+
+OWNER_PREFIX = "page_owner:"
+OWNER_TIMEOUT = getattr(settings, "PAGE_OWNER_TIMEOUT", 60 * 60)
+
+
+def page_validators(request, scopes, per_viewer=True):
+    """Возвращает (etag, last_modified) страницы по её областям."""
+    versions = feed_cache.get_versions(feed_cache.GLOBAL, *scopes)
+    viewer = csrf_secret = ""
+    if per_viewer and request.user.is_authenticated:
+        viewer = request.user.pk
+        csrf_secret = request.META.get("CSRF_COOKIE", "")
+    raw = ":".join(list(scopes) + versions
+                   + [str(viewer), csrf_secret, request.get_full_path()])
+    times = [feed_cache.version_time(version) for version in versions]
+    modified = (datetime.fromtimestamp(max(times), timezone.utc)
+                if None not in times else None)
+    return hashlib.md5(raw.encode()).hexdigest(), modified
+
+
+def request_validators(request):
+    """Валидаторы, уже посчитанные conditional_page для этого запроса."""
+    return getattr(request, "_page_validators", (None, None))
+
+
+def conditional_page(get_scopes, per_viewer=True):
+    """Декоратор представления: 304 Not Modified для свежей копии.
+
+    Ответ помечается ``private, no-cache``, чтобы браузер каждый раз
+    сверял свою копию, а не показывал её по эвристике свежести.
+
+    ``get_scopes`` получает аргументы представления и возвращает области
+    страницы или None, если их не определить (тогда страница строится
+    как обычно). С ``per_viewer=False`` ETag общий для всех читателей.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, "_page_validators"):
+            scopes = get_scopes(*args, **kwargs)
+            request._page_validators = (
+                (None, None) if scopes is None
+                else page_validators(request, scopes, per_viewer))
+        return request._page_validators
+
+    def etag(request, *args, **kwargs):
+        return validators(request, *args, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request, *args, **kwargs)[1]
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(
+            view)
+        return cache_control(private=True, no_cache=True)(view)
+
+    return decorator
+
+
+def _owner_id(model, field, value):
+    """id группы или автора по адресу страницы, запоминается в кэше.
+
+    Адреса меняются редко, а сигналы забывают и старый, и новый адрес
+    при изменении, поэтому повторная проверка свежести обходится без
+    запросов к БД. OWNER_TIMEOUT ограничивает ошибку, если сигнал
+    не сработал (например, при QuerySet.update).
+    """
+    key = f"{OWNER_PREFIX}{model._meta.model_name}:{value}"
+    owner_id = cache.get(key)
+    if owner_id is None:
+        owner_id = model.objects.filter(**{field: value}).values_list(
+            "pk", flat=True).first()
+        if owner_id is not None:
+            cache.set(key, owner_id, OWNER_TIMEOUT)
+    return owner_id
+
+
+def forget_owner(model, *values):
+    cache.delete_many([f"{OWNER_PREFIX}{model._meta.model_name}:{value}"
+                       for value in values if value is not None])
+
+
+def _author_id(username):
+    return _owner_id(User, "username", username)
+
+
+def index_scopes():
+    return [feed_cache.INDEX]
+
+
+def group_scopes(slug):
+    group_id = _owner_id(Group, "slug", slug)
+    if group_id is None:
+        return None
+    return [feed_cache.group_scope(group_id)]
+
+
+def profile_scopes(username):
+    author_id = _author_id(username)
+    if author_id is None:
+        return None
+    return [feed_cache.profile_scope(author_id),
+            feed_cache.author_scope(author_id)]
+
+
+def post_scopes(username, post_id):
+    author_id = _author_id(username)
+    if author_id is None:
+        return None
+    return [feed_cache.post_scope(post_id),
+            feed_cache.profile_scope(author_id),
+            feed_cache.author_scope(author_id)]
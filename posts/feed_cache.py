@@ -0,0 +1,107 @@
+"""Версионированный кэш фрагментов лент.
+
+Ключ фрагмента содержит версии областей (лента, группа, автор, подписки)
+и позицию страницы. Сигналы записи меняют версию затронутых областей,
+поэтому фрагменты можно хранить долго: устаревшие просто перестают
+запрашиваться и вытесняются кэшем.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+from .timeline import is_pull_author, pull_author_ids
+
+FEED_CACHE_TIMEOUT = getattr(settings, "FEED_CACHE_TIMEOUT", 60 * 60)
+VERSION_PREFIX = "feed_version:"
+
+GLOBAL = "global"
+INDEX = "index"
+
+
+def group_scope(group_id):
+    return f"group:{group_id}"
+
+
+def profile_scope(author_id):
+    return f"profile:{author_id}"
+
+
+def follow_scope(user_id):
+    return f"follow:{user_id}"
+
+
+def post_scope(post_id):
+    return f"post:{post_id}"
+
+
+def author_scope(author_id):
+    """Карточка автора: подписчики и кнопка подписки."""
+    return f"author:{author_id}"
+
+
+def _new_version():
+    return f"{int(time.time() * 1000):x}-{uuid.uuid4().hex[:8]}"
+
+
+def version_time(version):
+    """Время смены версии в секундах или None для версии без времени."""
+    stamp, separator, _ = str(version).partition("-")
+    if not separator:
+        return None
+    try:
+        return int(stamp, 16) / 1000
+    except ValueError:
+        return None
+
+
+def get_versions(*scopes):
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*scopes):
+    cache.set_many(
+        {VERSION_PREFIX + scope: _new_version() for scope in scopes}, None)
+
+
+def invalidate_post(post, previous_group_id=None, followers=True):
+    """Сбрасывает ленты, в которых показывается карточка записи.
+
+    С ``followers=False`` (комментарии) ленты подписчиков не трогаются:
+    ради счётчика комментариев не стоит менять тысячи версий, и он
+    обновится там по FEED_CACHE_TIMEOUT.
+    """
+    scopes = {INDEX, profile_scope(post.author_id), post_scope(post.pk)}
+    for group_id in (post.group_id, previous_group_id):
+        if group_id is not None:
+            scopes.add(group_scope(group_id))
+    if followers and not is_pull_author(post.author_id):
+        follower_ids = Follow.objects.filter(
+            author_id=post.author_id).values_list("user_id", flat=True)
+        scopes.update(follow_scope(user_id)
+                      for user_id in follower_ids.iterator())
+    invalidate(*scopes)
+
+
+def feed_cache_context(request, page, *scopes):
+    """Контекст для {% cache %} вокруг карточек ленты."""
+    position = request.GET.get("cursor") or f"page={page.number}"
+    versions = get_versions(GLOBAL, *scopes)
+    key = ":".join(list(scopes) + versions + [position])
+    return {"feed_key": key, "feed_cache_timeout": FEED_CACHE_TIMEOUT}
+
+
+def follow_scopes(user, author_ids=None):
+    """Области ленты подписок: своя версия и профили pull-авторов."""
+    if author_ids is None:
+        author_ids = pull_author_ids(user)
+    return [follow_scope(user.pk)] + [profile_scope(author_id)
+                                      for author_id in author_ids]
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import feeds
+
+urlpatterns = [
+    path("rss/", feeds.index_rss, name="feed_rss"),
+    path("atom/", feeds.index_atom, name="feed_atom"),
+    path("group/<slug:slug>/rss/", feeds.group_rss, name="group_feed_rss"),
+    path("group/<slug:slug>/atom/", feeds.group_atom,
+         name="group_feed_atom"),
+    path("<str:username>/rss/", feeds.author_rss, name="author_feed_rss"),
+    path("<str:username>/atom/", feeds.author_atom,
+         name="author_feed_atom"),
+]
@@ -0,0 +1,137 @@
+"""RSS и Atom: общая лента, ленты групп и авторов.
+
+Готовый XML хранится в кэше под ключом из версий областей ленты
+(см. feed_cache), поэтому опрос читалкой стоит одного обращения к кэшу,
+а с If-None-Match/If-Modified-Since — ответа 304.
+"""
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import truncatechars
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from .conditional import (conditional_page, group_scopes, index_scopes,
+                          profile_scopes, request_validators)
+from .feed_cache import FEED_CACHE_TIMEOUT
+from .models import Group, Post, User
+
+FEED_SIZE = 20
+TITLE_LENGTH = 60
+
+
+class PostFeed(Feed):
+    """Последние записи; наследники сужают выборку до группы или автора."""
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.posts(obj).select_related("author", "group").order_by(
+            "-pub_date")[:FEED_SIZE]
+
+    def item_title(self, item):
+        return truncatechars(item.text, TITLE_LENGTH)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse("post", args=[item.author.username, item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group_id else []
+
+
+class IndexFeed(PostFeed):
+    title = "Yatube: последние записи"
+    description = "Новые записи всех авторов"
+
+    def link(self):
+        return reverse("index")
+
+
+class GroupFeed(PostFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+    def title(self, obj):
+        return f"Yatube: {obj.title}"
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse("group_posts", args=[obj.slug])
+
+
+class AuthorFeed(PostFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+    def title(self, obj):
+        return f"Yatube: записи {obj.get_full_name() or obj.username}"
+
+    def description(self, obj):
+        return f"Новые записи автора {obj.username}"
+
+    def link(self, obj):
+        return reverse("profile", args=[obj.username])
+
+
+class IndexAtomFeed(IndexFeed):
+    feed_type = Atom1Feed
+    subtitle = IndexFeed.description
+
+
+class GroupAtomFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class AuthorAtomFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+def cached_feed(feed, get_scopes):
+    """Представление ленты: XML из кэша и условный GET для всех читателей."""
+    @conditional_page(get_scopes, per_viewer=False)
+    def view(request, *args, **kwargs):
+        etag, _ = request_validators(request)
+        if etag is None:
+            return feed(request, *args, **kwargs)
+        key = f"syndication:{etag}"
+        cached = cache.get(key)
+        if cached is None:
+            response = feed(request, *args, **kwargs)
+            cached = (response["Content-Type"], response.content)
+            cache.set(key, cached, FEED_CACHE_TIMEOUT)
+        content_type, content = cached
+        return HttpResponse(content, content_type=content_type)
+    return view
+
+
+index_rss = cached_feed(IndexFeed(), index_scopes)
+index_atom = cached_feed(IndexAtomFeed(), index_scopes)
+group_rss = cached_feed(GroupFeed(), group_scopes)
+group_atom = cached_feed(GroupAtomFeed(), group_scopes)
+author_rss = cached_feed(AuthorFeed(), profile_scopes)
+author_atom = cached_feed(AuthorAtomFeed(), profile_scopes)
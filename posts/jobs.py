@@ -0,0 +1,114 @@
+"""Долговечная очередь фоновых задач в БД.
+
+Задача — путь к функции и JSON с её именованными аргументами. Запись
+задачи коммитится вместе с данными запроса, а выполняет её отдельный
+процесс ``manage.py run_worker``. Упавшая задача повторяется с
+экспоненциальной задержкой, после max_attempts остаётся со статусом
+failed и текстом ошибки; успешная удаляется. Задача с ``dedup_key``
+ставится, только если в очереди нет другой с тем же ключом: это
+гарантирует частичный уникальный индекс, а не проверка перед вставкой.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import routers
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = getattr(settings, "JOB_BACKOFF_BASE", 30)
+BACKOFF_MAX = getattr(settings, "JOB_BACKOFF_MAX", 60 * 60)
+# Задача, взятая упавшим воркером, возвращается в очередь через столько
+# секунд.
+LOCK_TIMEOUT = getattr(settings, "JOB_LOCK_TIMEOUT", 10 * 60)
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=5, dedup_key=None):
+    """Ставит задачу; None, если задача с ``dedup_key`` уже в очереди."""
+    try:
+        with transaction.atomic():
+            return Job.objects.create(
+                name=name, payload=json.dumps(payload or {}),
+                run_at=timezone.now() + timedelta(seconds=delay),
+                max_attempts=max_attempts, dedup_key=dedup_key)
+    except IntegrityError:
+        if dedup_key is None:
+            raise
+        return None
+
+
+def backoff(attempts):
+    """Задержка в секундах перед повтором после ``attempts`` неудач."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def release_stale():
+    expired = timezone.now() - timedelta(seconds=LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=expired)
+    # Зависшая задача, у которой в очереди уже есть замена, не нужна.
+    stale.filter(dedup_key__in=Job.objects.filter(
+        status=Job.QUEUED).values("dedup_key")).delete()
+    return stale.update(status=Job.QUEUED, locked_at=None)
+
+
+def claim(limit):
+    """Забирает до ``limit`` готовых задач; безопасно из многих процессов.
+
+    Каждая задача переводится в running условным UPDATE, поэтому два
+    воркера не возьмут одну и ту же. Очередь читается из основной базы:
+    на реплике только что поставленной задачи может ещё не быть.
+    """
+    now = timezone.now()
+    with routers.use_primary():
+        candidates = list(Job.objects.filter(
+            status=Job.QUEUED, run_at__lte=now).order_by(
+            "run_at", "pk").values_list("pk", flat=True)[:limit])
+    return [pk for pk in candidates
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_at=now)]
+
+
+def run_job(job_id):
+    """Выполняет задачу и возвращает True при успехе.
+
+    Задача и всё, что она читает, берутся из основной базы. Пропавшая
+    задача (её уже выполнил воркер, взявший её после release_stale, или
+    удалили вручную) считается выполненной.
+    """
+    with routers.use_primary():
+        return _run(job_id)
+
+
+def _run(job_id):
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        logger.warning("Задача #%s уже выполнена или удалена", job_id)
+        return True
+    try:
+        import_string(job.name)(**json.loads(job.payload))
+    except Exception:
+        attempts = job.attempts + 1
+        failed = attempts >= job.max_attempts
+        logger.exception("Задача %s #%s упала (попытка %s)",
+                         job.name, job.pk, attempts)
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job_id).update(
+                    attempts=attempts, locked_at=None,
+                    status=Job.FAILED if failed else Job.QUEUED,
+                    run_at=timezone.now() + timedelta(
+                        seconds=backoff(attempts)),
+                    last_error=traceback.format_exc())
+        except IntegrityError:
+            # Такая же задача уже снова в очереди и выполнит работу.
+            Job.objects.filter(pk=job_id).delete()
+        return False
+    Job.objects.filter(pk=job_id).delete()
+    return True
@@ -0,0 +1,27 @@
+"""Отправка почты через очередь задач вместо запроса пользователя."""
+import base64
+import pickle
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from .jobs import enqueue
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Кладёт письма в очередь; run_worker отправляет их через
+    settings.QUEUED_EMAIL_BACKEND."""
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            message.connection = None
+            enqueue("posts.mail.deliver", {"message": base64.b64encode(
+                pickle.dumps(message)).decode()})
+        return len(email_messages)
+
+
+def deliver(message):
+    email = pickle.loads(base64.b64decode(message))
+    get_connection(settings.QUEUED_EMAIL_BACKEND,
+                   fail_silently=False).send_messages([email])
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from posts.cache_backends import SQLiteCache
+
+COUNTER = "bench:counter"
+PARAMS = {"OPTIONS": {"MAX_ENTRIES": 10000}}
+
+
+def make_backends(directory):
+    return {
+        "locmem": lambda: LocMemCache("bench", PARAMS),
+        "filebased": lambda: FileBasedCache(
+            os.path.join(directory, "files"), PARAMS),
+        "sqlite": lambda: SQLiteCache(
+            os.path.join(directory, "cache.sqlite3"), PARAMS),
+    }
+
+
+def _incr_worker(factory, iterations):
+    cache = factory()
+    for _ in range(iterations):
+        try:
+            cache.incr(COUNTER)
+        except ValueError:
+            cache.add(COUNTER, 0)
+            cache.incr(COUNTER)
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает LocMemCache, FileBasedCache и SQLiteCache: "
+            "операции в секунду и общий счётчик между процессами")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=5000)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def timed(self, iterations, operation):
+        started = time.perf_counter()
+        for i in range(iterations):
+            operation(i)
+        return iterations / (time.perf_counter() - started)
+
+    def bench(self, cache, iterations):
+        fragment = "<article>карточка</article>" * 40
+        versions = {f"feed_version:scope{i}": i for i in range(5)}
+        cache.set_many(versions)
+        cache.set(COUNTER, 0)
+        return {
+            "set": self.timed(iterations, lambda i: cache.set(
+                f"fragment:{i % 500}", fragment)),
+            "get": self.timed(iterations, lambda i: cache.get(
+                f"fragment:{i % 500}")),
+            "get_many": self.timed(iterations,
+                                   lambda i: cache.get_many(versions)),
+            "incr": self.timed(iterations, lambda i: cache.incr(COUNTER)),
+        }
+
+    def shared_counter(self, factory, workers, iterations):
+        factory().delete(COUNTER)
+        processes = [multiprocessing.Process(target=_incr_worker,
+                                             args=(factory, iterations))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return factory().get(COUNTER, 0)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        workers = options["workers"]
+        columns = ("set", "get", "get_many", "incr")
+        self.stdout.write(f"{'бэкенд':<10}" + "".join(
+            f"{name:>12}" for name in columns) + f"{'счётчик':>12}")
+        with tempfile.TemporaryDirectory() as directory:
+            for name, factory in make_backends(directory).items():
+                rates = self.bench(factory(), iterations)
+                total = self.shared_counter(factory, workers, iterations)
+                self.stdout.write(f"{name:<10}" + "".join(
+                    f"{rates[column]:>12.0f}" for column in columns)
+                    + f"{total:>6}/{workers * iterations:<5}")
+        self.stdout.write("Операций в секунду; счётчик — итог incr() из "
+                          f"{workers} процессов (общий кэш видит все).")
@@ -0,0 +1,92 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.benchmarks import (ViewBenchmark, busiest_follower, data_sizes,
+                              default_urls, login_cookie, percentile)
+from posts.middleware import view_query_stats
+
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+
+
+class Command(BaseCommand):
+    help = ("Пропускная способность, перцентили задержки и число запросов "
+            "к БД для страниц лент и записи через WSGI")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Запросов на страницу и уровень потоков")
+        parser.add_argument("--concurrency", default="1,4,8",
+                            help="Число потоков через запятую")
+        parser.add_argument("--label", default="",
+                            help="Подпись прогона в отчёте")
+        parser.add_argument("--report",
+                            help="Файл JSON Lines: прогон дописывается в "
+                                 "конец, затем выводится сравнение прогонов")
+
+    def handle(self, *args, **options):
+        urls = default_urls()
+        if not urls:
+            raise CommandError("В базе нет записей для прогона")
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        sizes = data_sizes()
+        self.stdout.write(", ".join(f"{name}: {count}"
+                                    for name, count in sizes.items()))
+        cookie = login_cookie(busiest_follower())
+        benchmark = ViewBenchmark()
+        self.stdout.write(f"{'страница':<14}{'потоков':>8}{'запр/с':>9}"
+                          f"{'p50 мс':>9}{'p90 мс':>9}{'p99 мс':>9}"
+                          f"{'запр. БД':>10}{'ошибок':>8}")
+        results = []
+        for name, url in urls.items():
+            for level in levels:
+                view_query_stats.reset()
+                rate, durations, errors = benchmark.run(
+                    url, options["requests"], level, cookie)
+                stats = view_query_stats.snapshot().values()
+                queries = (sum(item["queries"] for item in stats) /
+                           max(sum(item["requests"] for item in stats), 1))
+                result = {"view": name, "concurrency": level,
+                          "rate": round(rate, 1), "queries": round(queries, 1),
+                          "errors": errors}
+                for key, fraction in PERCENTILES:
+                    result[key] = round(
+                        percentile(durations, fraction) * 1000, 2)
+                results.append(result)
+                self.stdout.write(
+                    f"{name:<14}{level:>8}{rate:>9.0f}{result['p50']:>9.1f}"
+                    f"{result['p90']:>9.1f}{result['p99']:>9.1f}"
+                    f"{queries:>10.1f}{errors:>8}")
+        if options["report"]:
+            self.append_report(options["report"], {
+                "label": options["label"],
+                "date": timezone.now().isoformat(timespec="seconds"),
+                "sizes": sizes, "requests": options["requests"],
+                "results": results})
+
+    def append_report(self, path, run):
+        with open(path, "a", encoding="utf-8") as report:
+            report.write(json.dumps(run, ensure_ascii=False) + "\n")
+        with open(path, encoding="utf-8") as report:
+            runs = [json.loads(line) for line in report if line.strip()]
+        self.stdout.write(f"\nСравнение прогонов из {os.path.basename(path)} "
+                          f"(p50/p99 мс при наибольшем числе потоков):")
+        views = list(dict.fromkeys(result["view"] for item in runs
+                                   for result in item["results"]))
+        self.stdout.write(f"{'прогон':<24}{'записей':>9}" + "".join(
+            f"{view:>20}" for view in views))
+        for item in runs:
+            top = {}
+            for result in item["results"]:
+                current = top.get(result["view"])
+                if current is None or (result["concurrency"] >
+                                       current["concurrency"]):
+                    top[result["view"]] = result
+            cells = "".join(
+                f"{top[view]['p50']:>12.1f}/{top[view]['p99']:<7.1f}"
+                if view in top else f"{'—':>20}" for view in views)
+            title = item["label"] or item["date"]
+            self.stdout.write(f"{title[:23]:<24}"
+                              f"{item['sizes']['posts']:>9}{cells}")
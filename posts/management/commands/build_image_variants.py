@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Строит миниатюры и адаптивные варианты картинок записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Перестроить варианты и у готовых записей")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image=None)
+        if not options["all"]:
+            posts = posts.filter(image_variants=None)
+        total = 0
+        for post_id in posts.values_list("pk", flat=True).iterator():
+            thumbnails.generate(post_id)
+            total += 1
+        self.stdout.write(f"Обработано записей: {total}")
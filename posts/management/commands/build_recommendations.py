@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает рекомендации «кого почитать» по графу подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stale", action="store_true",
+                            help="Только помеченные устаревшими")
+        parser.add_argument("--python", action="store_true",
+                            help="Считать без numpy/scipy")
+
+    def handle(self, *args, **options):
+        vectorized = not options["python"]
+        if vectorized and recommendations.sparse is None:
+            self.stdout.write("numpy/scipy не установлены, "
+                              "считаем без них")
+            vectorized = False
+        started = time.monotonic()
+        if options["stale"]:
+            changed = recommendations.refresh_stale(vectorized)
+        else:
+            changed = recommendations.build_all(vectorized)
+        self.stdout.write(f"Изменились рекомендации у {changed} "
+                          f"пользователей за "
+                          f"{time.monotonic() - started:.1f} с")
@@ -0,0 +1,91 @@
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import urls as posts_urls
+from posts.benchmarks import HOST, busiest_follower
+from posts.models import Post
+from posts.query_plans import StatementRecorder, analyze, index_operation
+
+DUMMY_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+class Command(BaseCommand):
+    help = ("Открывает все страницы posts.urls на заполненной базе, "
+            "проверяет EXPLAIN QUERY PLAN каждого запроса и предлагает "
+            "индексы")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true",
+                            help="Печатать планы всех запросов, "
+                                 "а не только проблемных")
+
+    def handle(self, *args, **options):
+        sample = self.sample_kwargs()
+        client = Client(HTTP_HOST=HOST)
+        client.force_login(busiest_follower())
+        suggestions = {}
+        # Кэш отключён, чтобы видеть запросы холодной страницы; всё, что
+        # страницы запишут (подписка, комментарий), откатывается.
+        with override_settings(CACHES=DUMMY_CACHE), transaction.atomic():
+            for pattern in posts_urls.urlpatterns:
+                url = reverse(pattern.name, kwargs={
+                    name: sample[name] for name in pattern.pattern.converters})
+                if pattern.name == "search":
+                    url += f"?q={sample['query']}"
+                findings = self.explain_url(client, url)
+                self.report(pattern.name, url, findings,
+                            options["verbose_plans"])
+                for finding in findings:
+                    for model, fields in finding.suggestions:
+                        suggestions.setdefault(
+                            index_operation(model, fields), []).append(
+                            pattern.name)
+            transaction.set_rollback(True)
+        if not suggestions:
+            self.stdout.write("\nНедостающих индексов не найдено")
+            return
+        self.stdout.write("\nПредлагаемые индексы (добавьте в Meta.indexes "
+                          "и выполните makemigrations):")
+        for operation, names in suggestions.items():
+            self.stdout.write(f"  {operation}  # "
+                              f"{', '.join(dict.fromkeys(names))}")
+
+    def sample_kwargs(self):
+        """Аргументы маршрутов: самая обсуждаемая запись и её автор."""
+        post = Post.objects.order_by("-comment_count").select_related(
+            "author").first()
+        grouped = Post.objects.filter(group__isnull=False).select_related(
+            "group").first()
+        if post is None or grouped is None:
+            raise CommandError("Заполните базу: manage.py seed_data")
+        return {"slug": grouped.group.slug, "post_id": post.pk,
+                "username": post.author.username,
+                "query": post.text.split()[0]}
+
+    def explain_url(self, client, url):
+        recorder = StatementRecorder()
+        with self.recording(recorder):
+            client.get(url)
+        return [analyze(statement) for statement in recorder.statements]
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def report(self, name, url, findings, verbose):
+        flagged = [finding for finding in findings if finding.problems]
+        self.stdout.write(f"{name:<18}{url:<40}запросов: {len(findings)}, "
+                          f"проблемных: {len(flagged)}")
+        for finding in findings if verbose else flagged:
+            self.stdout.write(f"    {finding.statement.sql[:200]}")
+            for line in finding.plan:
+                self.stdout.write(f"      | {line}")
+            for problem in finding.problems:
+                self.stdout.write(self.style.WARNING(f"      ! {problem}"))
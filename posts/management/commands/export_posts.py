@@ -0,0 +1,60 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Follow, Group, Post
+
+
+class Command(BaseCommand):
+    help = "Выгружает группы, записи, комментарии и подписки в JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", nargs="?", default="-",
+                            help="Файл для выгрузки, по умолчанию stdout")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def rows(self, chunk_size):
+        groups = Group.objects.order_by("pk").values(
+            "slug", "title", "description")
+        for row in groups.iterator(chunk_size=chunk_size):
+            yield {"type": "group", **row}
+
+        posts = Post.objects.order_by("pk").values_list(
+            "pk", "author__username", "group__slug", "text", "pub_date",
+            "image")
+        for pk, author, group, text, pub_date, image in posts.iterator(
+                chunk_size=chunk_size):
+            yield {"type": "post", "id": pk, "author": author,
+                   "group": group, "text": text,
+                   "pub_date": pub_date.isoformat(), "image": image or ""}
+
+        comments = Comment.objects.order_by("pk").values_list(
+            "post_id", "author__username", "text", "created")
+        for post_id, author, text, created in comments.iterator(
+                chunk_size=chunk_size):
+            yield {"type": "comment", "post": post_id, "author": author,
+                   "text": text, "created": created.isoformat()}
+
+        follows = Follow.objects.order_by("pk").values_list(
+            "user__username", "author__username")
+        for user, author in follows.iterator(chunk_size=chunk_size):
+            yield {"type": "follow", "user": user, "author": author}
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        stream = (self.stdout if output == "-"
+                  else open(output, "w", encoding="utf-8"))
+        started = time.monotonic()
+        total = 0
+        try:
+            for row in self.rows(options["chunk_size"]):
+                stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+                total += 1
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f"Выгружено строк: {total} за {elapsed:.1f} с "
+            f"({total / max(elapsed, 1e-9):.0f} строк/с)")
@@ -0,0 +1,187 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from posts import feed_cache, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+ORDER = ("group", "post", "comment", "follow")
+LOOKUP_CACHE_LIMIT = 100000
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max("pk"))["last"] or 0
+
+
+def reset_sequences(*models):
+    """Сдвигает последовательности id за строки, вставленные с явным id."""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+@contextmanager
+def keep_dates(*fields):
+    """Отключает auto_now_add, чтобы сохранить даты из выгрузки."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ("Загружает группы, записи, комментарии и подписки из JSONL. "
+            "Id записей из выгрузки сдвигаются за последний id в базе")
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", nargs="?", default="-",
+                            help="Файл выгрузки, по умолчанию stdin")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.user_ids = {}
+        self.group_ids = {}
+        self.buffers = {kind: [] for kind in ORDER}
+        self.counts = dict.fromkeys(ORDER, 0)
+        source = options["input"]
+        stream = (sys.stdin if source == "-"
+                  else open(source, encoding="utf-8"))
+        # В непустой базе id из выгрузки заняты: записи получают
+        # id + post_offset, ссылки комментариев сдвигаются так же.
+        self.post_offset = last_id(Post)
+        follow_offset = last_id(Follow)
+        started = time.monotonic()
+        try:
+            with keep_dates(Post._meta.get_field("pub_date"),
+                            Comment._meta.get_field("created")):
+                self.load(stream)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        loaded = time.monotonic() - started
+        reset_sequences(Post)
+
+        call_command("recount_comments", stdout=self.stdout)
+        call_command("rebuild_trending", stdout=self.stdout)
+        call_command("rebuild_user_stats", stdout=self.stdout)
+        with transaction.atomic():
+            entries = timeline.fan_out_since(self.post_offset, follow_offset)
+            timeline.cap_all_timelines()
+        self.stdout.write(f"Записей в лентах: {entries}")
+        call_command("reindex_posts", stdout=self.stdout)
+        feed_cache.invalidate(feed_cache.GLOBAL)
+
+        total = sum(self.counts.values())
+        for kind in ORDER:
+            self.stdout.write(f"{kind}: {self.counts[kind]}")
+        self.stdout.write(
+            f"Загружено строк: {total} за {loaded:.1f} с "
+            f"({total / max(loaded, 1e-9):.0f} строк/с), всего "
+            f"{time.monotonic() - started:.1f} с")
+
+    def load(self, stream):
+        current = None
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                kind = row["type"]
+            except (ValueError, KeyError):
+                raise CommandError(f"Строка {number}: неверный формат")
+            if kind not in self.buffers:
+                raise CommandError(f"Строка {number}: неизвестный тип {kind}")
+            if kind != current:
+                self.flush_all()
+                current = kind
+            self.buffers[kind].append(row)
+            if len(self.buffers[kind]) >= self.batch_size:
+                self.flush(kind)
+        self.flush_all()
+
+    def flush_all(self):
+        for kind in ORDER:
+            self.flush(kind)
+
+    def flush(self, kind):
+        rows = self.buffers[kind]
+        if not rows:
+            return
+        with transaction.atomic():
+            getattr(self, f"import_{kind}s")(rows)
+        self.counts[kind] += len(rows)
+        self.buffers[kind] = []
+
+    def resolve_users(self, usernames):
+        if len(self.user_ids) > LOOKUP_CACHE_LIMIT:
+            self.user_ids.clear()
+        missing = set(usernames) - self.user_ids.keys()
+        if not missing:
+            return
+        found = dict(User.objects.filter(username__in=missing).values_list(
+            "username", "pk"))
+        new = missing - found.keys()
+        if new:
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None))
+                 for name in new])
+            found.update(User.objects.filter(username__in=new).values_list(
+                "username", "pk"))
+        self.user_ids.update(found)
+
+    def resolve_groups(self, slugs):
+        missing = {slug for slug in slugs if slug} - self.group_ids.keys()
+        if missing:
+            self.group_ids.update(Group.objects.filter(
+                slug__in=missing).values_list("slug", "pk"))
+
+    def import_groups(self, rows):
+        existing = set(Group.objects.filter(
+            slug__in=[row["slug"] for row in rows]).values_list(
+            "slug", flat=True))
+        Group.objects.bulk_create(
+            [Group(slug=row["slug"], title=row["title"],
+                   description=row["description"])
+             for row in rows if row["slug"] not in existing])
+
+    def import_posts(self, rows):
+        self.resolve_users(row["author"] for row in rows)
+        self.resolve_groups(row["group"] for row in rows)
+        Post.objects.bulk_create(
+            [Post(id=self.post_offset + row["id"],
+                  author_id=self.user_ids[row["author"]],
+                  group_id=self.group_ids.get(row["group"]),
+                  text=row["text"], image=row["image"],
+                  pub_date=parse_datetime(row["pub_date"]))
+             for row in rows])
+
+    def import_comments(self, rows):
+        self.resolve_users(row["author"] for row in rows)
+        Comment.objects.bulk_create(
+            [Comment(post_id=self.post_offset + row["post"],
+                     author_id=self.user_ids[row["author"]],
+                     text=row["text"],
+                     created=parse_datetime(row["created"]))
+             for row in rows])
+
+    def import_follows(self, rows):
+        self.resolve_users([row["user"] for row in rows]
+                           + [row["author"] for row in rows])
+        Follow.objects.bulk_create(
+            [Follow(user_id=self.user_ids[row["user"]],
+                    author_id=self.user_ids[row["author"]])
+             for row in rows],
+            ignore_conflicts=True)
@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.profiling import (FOLDED_SUFFIX, profiler_dir, read_folded,
+                             summarize)
+
+
+class Command(BaseCommand):
+    help = ("Сводит сэмплы профилировщика по представлениям в "
+            "<view>.folded и печатает самые горячие функции")
+
+    def add_arguments(self, parser):
+        parser.add_argument("views", nargs="*",
+                            help="Имена маршрутов, по умолчанию все")
+        parser.add_argument("--top", type=int, default=15)
+
+    def handle(self, *args, **options):
+        directory = profiler_dir()
+        if not os.path.isdir(directory):
+            raise CommandError(f"Нет каталога профилей {directory}")
+        views = options["views"] or sorted(
+            name for name in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, name)))
+        for view in views:
+            view_dir = os.path.join(directory, view)
+            if not os.path.isdir(view_dir):
+                self.stderr.write(f"{view}: сэмплов нет")
+                continue
+            parts = [os.path.join(view_dir, name)
+                     for name in os.listdir(view_dir)
+                     if name.endswith(FOLDED_SUFFIX)]
+            merged_path = os.path.join(directory, view + FOLDED_SUFFIX)
+            stacks = None
+            for path in parts:
+                stacks = read_folded(path, stacks)
+            if not stacks:
+                self.stderr.write(f"{view}: сэмплов нет")
+                continue
+            with open(merged_path, "w", encoding="utf-8") as output:
+                for stack, count in sorted(stacks.items()):
+                    output.write(f"{stack} {count}\n")
+            self.write_summary(view, merged_path, stacks, options["top"])
+
+    def write_summary(self, view, path, stacks, top):
+        total, own, inclusive = summarize(stacks, top)
+        self.stdout.write(f"== {view}: {total} сэмплов -> {path}")
+        self.stdout.write("  собственное время:")
+        for name, count in own:
+            self.stdout.write(f"  {count / total:6.1%}  {name}")
+        self.stdout.write("  включительно:")
+        for name, count in inclusive:
+            self.stdout.write(f"  {count / total:6.1%}  {name}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed_cache, trending
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает оценки записей для ленты трендов по комментариям"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = trending.rebuild()
+        feed_cache.invalidate(feed_cache.INDEX)
+        self.stdout.write(f"Пересчитано записей: {total}")
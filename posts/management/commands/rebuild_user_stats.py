@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Пересобирает счётчики подписчиков, подписок и записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = rebuild_all(batch_size=options["batch_size"])
+        self.stdout.write(f"Пересчитано пользователей: {total}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики комментариев у записей"
+
+    def handle(self, *args, **options):
+        counts = Comment.objects.filter(post=OuterRef("pk")).order_by().values(
+            "post").annotate(total=Count("id")).values("total")
+        with transaction.atomic():
+            fixed = Post.objects.exclude(
+                comment_count=Coalesce(Subquery(counts), 0)).update(
+                comment_count=Coalesce(Subquery(counts), 0))
+        self.stdout.write(f"Исправлено записей: {fixed}")
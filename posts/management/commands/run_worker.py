@@ -0,0 +1,52 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import worker
+from posts.jobs import claim, release_stale, run_job
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2,
+                            help="Число процессов; 0 — в этом процессе")
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument("--poll", type=float, default=1.0,
+                            help="Пауза в секундах при пустой очереди")
+        parser.add_argument("--once", action="store_true",
+                            help="Выйти, когда очередь опустеет")
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        if processes:
+            pool = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=worker.setup)
+            execute = pool.map
+        else:
+            pool = None
+            execute = map
+        done = failed = 0
+        try:
+            while True:
+                release_stale()
+                job_ids = claim(options["batch_size"])
+                if not job_ids:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                for ok in execute(run_job if pool is None else worker.run,
+                                  job_ids):
+                    done += ok
+                    failed += not ok
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(f"Выполнено задач: {done}, с ошибкой: {failed}")
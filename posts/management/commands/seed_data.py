@@ -0,0 +1,223 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from posts import feed_cache, timeline
+from posts.management.commands.import_posts import (keep_dates,
+                                                    reset_sequences)
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+
+WORDS = ("лето море город книга утро дорога кофе музыка друг вечер поезд "
+         "горы река фото кино работа праздник снег дождь солнце история "
+         "кот собака парк мост ужин завтрак новость проект код").split()
+IMAGE_POOL = 8
+BURST_THRESHOLD = 50
+BURST_WINDOW = 6 * 60 * 60
+
+
+class Command(BaseCommand):
+    help = ("Генерирует синтетических пользователей, группы, подписки, "
+            "записи и комментарии со степенным распределением активности")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--follows", type=int, default=20,
+                            help="Среднее число подписок пользователя")
+        parser.add_argument("--comments", type=float, default=2.0,
+                            help="Среднее число комментариев к записи")
+        parser.add_argument("--burst-ratio", type=float, default=0.005,
+                            help="Доля записей со всплеском комментариев")
+        parser.add_argument("--burst-size", type=int, default=500)
+        parser.add_argument("--image-ratio", type=float, default=0.1)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--skew", type=float, default=1.1,
+                            help="Показатель Ципфа для популярности авторов")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        started = time.monotonic()
+
+        user_ids = self.create_users(options["users"])
+        group_ids = self.create_groups(options["groups"])
+        # И подписчики, и активность распределены по Ципфу, но
+        # независимо: самый читаемый автор не обязательно пишет больше всех.
+        self.pick_followed = self.zipf_picker(user_ids)
+        self.pick_authors = self.zipf_picker(user_ids)
+
+        self.create_follows(user_ids)
+        call_command("rebuild_user_stats", stdout=self.stdout)
+        images = self.create_images(options["image_ratio"])
+        with keep_dates(Post._meta.get_field("pub_date"),
+                        Comment._meta.get_field("created")):
+            self.create_posts(group_ids, images)
+        reset_sequences(User, Group, Post)
+        call_command("rebuild_user_stats", stdout=self.stdout)
+        call_command("reindex_posts", stdout=self.stdout)
+        call_command("rebuild_trending", stdout=self.stdout)
+        feed_cache.invalidate(feed_cache.GLOBAL)
+        self.stdout.write(f"Готово за {time.monotonic() - started:.1f} с")
+
+    def zipf_picker(self, ids):
+        ranked = ids[:]
+        self.random.shuffle(ranked)
+        cum_weights = list(accumulate(
+            1 / (rank + 1) ** self.options["skew"]
+            for rank in range(len(ranked))))
+        return lambda k: self.random.choices(ranked, cum_weights=cum_weights,
+                                             k=k)
+
+    def next_id(self, model):
+        return (model.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+
+    def create_users(self, total):
+        first = self.next_id(User)
+        password = make_password(None)
+        for start in range(first, first + total, self.batch_size):
+            stop = min(start + self.batch_size, first + total)
+            User.objects.bulk_create(
+                [User(id=pk, username=f"seed{pk}", password=password,
+                      first_name=self.random.choice(WORDS).title())
+                 for pk in range(start, stop)])
+        self.stdout.write(f"Пользователей: {total}")
+        return list(range(first, first + total))
+
+    def create_groups(self, total):
+        first = self.next_id(Group)
+        Group.objects.bulk_create(
+            [Group(id=pk, slug=f"seed-{pk}", title=f"Сообщество {pk}",
+                   description=" ".join(self.random.sample(WORDS, 8)))
+             for pk in range(first, first + total)])
+        self.stdout.write(f"Групп: {total}")
+        return list(range(first, first + total))
+
+    def create_follows(self, user_ids):
+        average = self.options["follows"]
+        batch = []
+        total = 0
+        for user_id in user_ids:
+            wanted = min(int(self.random.expovariate(1 / average)) + 1,
+                         len(user_ids) - 1) if average else 0
+            authors = set(self.pick_followed(wanted)) - {user_id}
+            batch.extend(Follow(user_id=user_id, author_id=author_id)
+                         for author_id in authors)
+            if len(batch) >= self.batch_size:
+                total += self.flush(Follow, batch)
+        total += self.flush(Follow, batch)
+        self.stdout.write(f"Подписок: {total}")
+
+    def flush(self, model, batch):
+        count = len(batch)
+        if count:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            batch.clear()
+        return count
+
+    def create_images(self, ratio):
+        if not ratio:
+            return []
+        from PIL import Image
+
+        names = []
+        for number in range(IMAGE_POOL):
+            picture = Image.new("RGB", (960, 540), tuple(
+                self.random.randrange(256) for _ in range(3)))
+            buffer = io.BytesIO()
+            picture.save(buffer, "JPEG")
+            names.append(default_storage.save(
+                f"posts/seed_{number}.jpg", ContentFile(buffer.getvalue())))
+        return names
+
+    def comment_total(self):
+        if self.random.random() < self.options["burst_ratio"]:
+            return self.random.randint(self.options["burst_size"] // 2,
+                                       self.options["burst_size"])
+        mean = self.options["comments"]
+        return int(self.random.expovariate(1 / mean)) if mean else 0
+
+    def create_posts(self, group_ids, images):
+        total = self.options["posts"]
+        now = timezone.now()
+        span = timedelta(days=self.options["days"]).total_seconds()
+        # Даты по возрастанию, чтобы id записей шли в порядке публикации.
+        offsets = sorted((self.random.random() * span for _ in range(total)),
+                         reverse=True)
+        first = self.next_id(Post)
+        comments = []
+        created_comments = 0
+        for start in range(0, total, self.batch_size):
+            posts = []
+            for index in range(start, min(start + self.batch_size, total)):
+                pub_date = now - timedelta(seconds=offsets[index])
+                count = self.comment_total()
+                image = (self.random.choice(images) if images and
+                         self.random.random() < self.options["image_ratio"]
+                         else "")
+                post = Post(
+                    id=first + index, author_id=self.pick_authors(1)[0],
+                    group_id=(self.random.choice(group_ids)
+                              if group_ids and self.random.random() < 0.6
+                              else None),
+                    text=" ".join(self.random.choices(
+                        WORDS, k=self.random.randint(5, 60))).capitalize(),
+                    pub_date=pub_date, image=image, comment_count=count)
+                posts.append(post)
+                comments.extend(self.post_comments(post, count, now))
+            with transaction.atomic():
+                Post.objects.bulk_create(posts)
+                self.fan_out(posts[0].pk, posts[-1].pk)
+                for chunk in range(0, len(comments), self.batch_size):
+                    Comment.objects.bulk_create(
+                        comments[chunk:chunk + self.batch_size])
+            created_comments += len(comments)
+            comments = []
+            self.stdout.write(f"Записей: {start + len(posts)} из {total}")
+        timeline.cap_all_timelines()
+        self.stdout.write(f"Комментариев: {created_comments}")
+
+    def post_comments(self, post, count, now):
+        window = max((now - post.pub_date).total_seconds(), 1)
+        if count > BURST_THRESHOLD:
+            # Всплеск: комментарии кучно в первые часы после публикации.
+            window = min(window, BURST_WINDOW)
+        authors = self.pick_authors(count)
+        return [Comment(post_id=post.pk, author_id=author_id,
+                        text=" ".join(self.random.choices(WORDS, k=6)),
+                        created=post.pub_date + timedelta(
+                            seconds=self.random.random() * window))
+                for author_id in authors]
+
+    def fan_out(self, first_id, last_id):
+        """Раскладывает записи по лентам подписчиков одним INSERT ... SELECT.
+
+        Как и timeline.fan_out_post, пропускает pull-авторов.
+        """
+        entry = TimelineEntry._meta
+        follow = Follow._meta
+        post = Post._meta
+        stats = UserStats._meta
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {entry.db_table} (user_id, post_id, pub_date) "
+                f"SELECT f.user_id, p.id, p.pub_date FROM {post.db_table} p "
+                f"JOIN {follow.db_table} f ON f.author_id = p.author_id "
+                f"WHERE p.id BETWEEN %s AND %s AND p.author_id NOT IN ("
+                f"SELECT user_id FROM {stats.db_table} WHERE followers > %s)",
+                [first_id, last_id, timeline.FANOUT_LIMIT])
@@ -0,0 +1,33 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts.routers import PRIMARY
+
+
+class Command(BaseCommand):
+    help = ("Копирует основную базу SQLite в файлы реплик "
+            "(локальная замена репликации)")
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if not replicas:
+            raise CommandError("В DATABASE_REPLICAS нет реплик")
+        aliases = [PRIMARY, *replicas]
+        if any(connections[alias].vendor != "sqlite" for alias in aliases):
+            raise CommandError("Копирование поддерживается только для SQLite")
+        source = sqlite3.connect(connections[PRIMARY].settings_dict["NAME"])
+        try:
+            for alias in replicas:
+                connections[alias].close()
+                target = sqlite3.connect(
+                    connections[alias].settings_dict["NAME"])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: скопирована")
+        finally:
+            source.close()
@@ -0,0 +1,236 @@
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+
+from . import conditional, profiling
+
+
+class QueryRecorder:
+    """Считает запросы к БД, их время и повторы внутри одного запроса."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(total - 1 for total in self.statements.values())
+
+    def record(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class ViewQueryStats:
+    """Накопленная статистика запросов к БД по именам представлений."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, recorder):
+        with self._lock:
+            stats = self._views.setdefault(view_name, {
+                "requests": 0, "queries": 0, "db_time": 0.0,
+                "duplicates": 0, "max_queries": 0})
+            stats["requests"] += 1
+            stats["queries"] += recorder.count
+            stats["db_time"] += recorder.duration
+            stats["duplicates"] += recorder.duplicates
+            stats["max_queries"] = max(stats["max_queries"], recorder.count)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_query_stats = ViewQueryStats()
+
+
+class QueryStatsMiddleware:
+    """Пишет число запросов, время БД и повторы по представлениям.
+
+    В режиме DEBUG те же числа отдаются в заголовках ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else "<unresolved>"
+        view_query_stats.add(view_name, recorder)
+        if settings.DEBUG:
+            response["X-View-Name"] = view_name
+            response["X-DB-Query-Count"] = str(recorder.count)
+            response["X-DB-Time-Ms"] = f"{recorder.duration * 1000:.2f}"
+            response["X-DB-Duplicate-Queries"] = str(recorder.duplicates)
+        return response
+
+
+class PageCacheStats:
+    """Попадания, промахи и обходы кэша страниц по представлениям."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, outcome):
+        with self._lock:
+            stats = self._views.setdefault(
+                view_name, {"hit": 0, "miss": 0, "bypass": 0})
+            stats[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+page_cache_stats = PageCacheStats()
+
+# Страницы, которые видят одинаково все анонимные посетители, и области
+# кэша лент, от которых они зависят.
+CACHED_PAGES = {
+    "index": conditional.index_scopes,
+    "trending": conditional.index_scopes,
+    "group_posts": conditional.group_scopes,
+    "profile": conditional.profile_scopes,
+    "post": conditional.post_scopes,
+}
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых страниц для посетителей без сессии.
+
+    Ключ — ETag страницы из conditional: версии её областей и полный путь
+    с параметрами. Сигналы записи (Post, Comment, Follow, Group) меняют
+    версии ровно тех областей, где видна изменённая строка, поэтому
+    устаревшие страницы просто перестают запрашиваться. Попадание не
+    трогает ни сессии, ни БД. Страницы с cookie в ответе не кэшируются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeout = getattr(settings, "PAGE_CACHE_TIMEOUT", 60 * 60)
+
+    def _view(self, request):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.url_name not in CACHED_PAGES:
+            return None
+        return match
+
+    def __call__(self, request):
+        match = self._view(request)
+        if match is None:
+            return self.get_response(request)
+        request.resolver_match = match
+        scopes = CACHED_PAGES[match.url_name](*match.args, **match.kwargs)
+        if scopes is None:
+            page_cache_stats.add(match.url_name, "bypass")
+            return self.get_response(request)
+        etag, last_modified = conditional.page_validators(
+            request, scopes, per_viewer=False)
+        key = f"page:{etag}"
+        cached = cache.get(key)
+        if cached is not None:
+            page_cache_stats.add(match.url_name, "hit")
+            content, headers = cached
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            response = get_conditional_response(
+                request, etag=response.get("ETag"),
+                last_modified=last_modified and int(last_modified.timestamp()),
+                response=response)
+            return self._mark(response, "HIT")
+
+        response = self.get_response(request)
+        if (response.status_code == 200 and not response.streaming
+                and not response.cookies
+                and not request.META.get("CSRF_COOKIE_USED")
+                and not request.user.is_authenticated):
+            cache.set(key, (response.content, list(response.items())),
+                      self.timeout)
+            page_cache_stats.add(match.url_name, "miss")
+            return self._mark(response, "MISS")
+        page_cache_stats.add(match.url_name, "bypass")
+        return response
+
+    def _mark(self, response, outcome):
+        if settings.DEBUG:
+            response["X-Page-Cache"] = outcome
+        return response
+
+
+class SamplingProfilerMiddleware:
+    """Профилирует долю запросов к представлениям posts.views.
+
+    Доли задаются по имени маршрута в PROFILER_SAMPLE_RATES, например
+    ``{"follow_index": 0.05, "profile": 0.01}``; при пустом словаре
+    middleware отключается целиком и ничего не стоит.
+    """
+
+    def __init__(self, get_response):
+        self.rates = profiling.sample_rates()
+        if not self.rates:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.interval = getattr(settings, "PROFILER_INTERVAL", 0.005)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        sampler = getattr(request, "_stack_sampler", None)
+        if sampler is not None:
+            profiling.save_stacks(request.resolver_match.url_name,
+                                  sampler.stop())
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func.__module__ != "posts.views":
+            return None
+        rate = self.rates.get(request.resolver_match.url_name, 0)
+        if rate and random.random() < rate:
+            request._stack_sampler = profiling.StackSampler(
+                threading.get_ident(), self.interval)
+            request._stack_sampler.start()
+        return None
@@ -0,0 +1,58 @@
+# Generated by Django 2.2.6 on 2026-10-18 12:00
+
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+# Оценка трендов на момент миграции (см. posts.trending), без импорта
+# кода приложения: миграция не должна меняться вместе с ним. С другим
+# TRENDING_HALF_LIFE оценки пересчитывает команда rebuild_trending.
+HALF_LIFE = 6 * 60 * 60
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+BATCH_SIZE = 500
+
+
+def event_score(moment):
+    return (moment - EPOCH).total_seconds() / HALF_LIFE
+
+
+def combine(first, second):
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def score_posts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    last_pk = 0
+    while True:
+        batch = list(Post.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', 'pub_date')[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        scores = {pk: event_score(pub_date) for pk, pub_date in batch}
+        comments = Comment.objects.filter(post_id__in=scores).values_list(
+            'post_id', 'created')
+        for post_id, created in comments.iterator():
+            scores[post_id] = combine(scores[post_id], event_score(created))
+        Post.objects.bulk_update(
+            [Post(pk=pk, trending_score=score)
+             for pk, score in scores.items()], ['trending_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(score_posts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -13,6 +14,21 @@ class Group(models.Model):
         return f'Группа - {self.title}'
 
 
+class PostQuerySet(models.QuerySet):
+    def for_cards(self):
+        """Записи со всем, что нужно карточке post_card.html.
+
+        Автор и группа подтягиваются одним запросом, варианты картинок —
+        ещё одним, счётчик комментариев хранится в самой записи.
+        Неиспользуемые в карточке столбцы не загружаются.
+        """
+        return self.select_related("author", "group").prefetch_related(
+            "image_variants").defer(
+            "author__password", "author__last_login",
+            "author__is_superuser", "author__is_staff", "author__is_active",
+            "author__date_joined", "author__email", "group__description")
+
+
 class Post(models.Model):
     text = models.TextField(help_text="Введите текст", verbose_name="Текст")
     pub_date = models.DateTimeField("date_published", auto_now_add=True,
@@ -26,14 +42,40 @@ class Post(models.Model):
     image = models.ImageField(upload_to='posts/', blank=True, null=True,
                               help_text="Загрузите картинку",
                               verbose_name="Картинка")
+    comment_count = models.PositiveIntegerField(default=0, editable=False,
+                                                verbose_name="Комментарии")
+    # См. posts.trending: логарифм затухающей суммы публикации и
+    # комментариев, поддерживается сигналами.
+    trending_score = models.FloatField(default=0, editable=False,
+                                       db_index=True)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [models.Index(fields=["author", "-pub_date"]),
+                   models.Index(fields=["group", "-pub_date"])]
 
     def __str__(self):
         return self.text
 
 
+class PostImageVariant(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="image_variants")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    image = models.ImageField(max_length=255)
+
+    class Meta:
+        ordering = ["width"]
+        unique_together = ('post', 'width', 'format')
+
+    def __str__(self):
+        return f'{self.format} {self.width}w - {self.post_id}'
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
                              related_name="comments")
@@ -45,6 +87,7 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["-created"]
+        indexes = [models.Index(fields=["post", "-created"])]
 
     def __str__(self):
         return self.text
@@ -59,3 +102,75 @@ class Follow(models.Model):
     class Meta:
         unique_together = ('user', 'author')
 
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="timeline_entries")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [models.Index(fields=['user', '-pub_date', '-post'])]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name="stats")
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    # Подписки пользователя или его читателей изменились, рекомендации
+    # нужно пересчитать (см. recommendations.refresh_stale).
+    recommendations_stale = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f'Статистика - {self.user}'
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="recommendations")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="recommended_to")
+    score = models.FloatField()
+    mutual = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-score"]
+        unique_together = ('user', 'author')
+        indexes = [models.Index(fields=['user', '-score'])]
+
+    def __str__(self):
+        return f'{self.author} для {self.user}'
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUSES = [(QUEUED, "В очереди"), (RUNNING, "Выполняется"),
+                (FAILED, "Ошибка")]
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Задач с одним ключом в очереди может быть не больше одной.
+    dedup_key = models.CharField(max_length=100, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        constraints = [models.UniqueConstraint(
+            fields=['dedup_key'], condition=models.Q(status='queued'),
+            name='unique_queued_job')]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
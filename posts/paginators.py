@@ -0,0 +1,159 @@
+import base64
+import binascii
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+AFTER = "a"
+BEFORE = "b"
+
+
+def encode_cursor(obj, direction, date_field="pub_date"):
+    """Упаковывает позицию объекта (дата, id) в непрозрачный токен."""
+    raw = f"{direction}|{getattr(obj, date_field).isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Возвращает (direction, дата, id) или None для битого токена."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, date, pk = raw.split("|")
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if direction not in (AFTER, BEFORE) or date is None:
+        return None
+    return direction, date, pk
+
+
+class CursorPage:
+    """Страница ленты, полученная по курсору.
+
+    Повторяет интерфейс django.core.paginator.Page, которым пользуются
+    шаблоны, но не знает ни номера страницы, ни общего количества записей.
+    """
+
+    def __init__(self, object_list, has_next, has_previous,
+                 date_field="pub_date"):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.date_field = date_field
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if self.has_next():
+            # len, а не [-1]: object_list может быть QuerySet.
+            return encode_cursor(self.object_list[len(self) - 1], AFTER,
+                                 self.date_field)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous():
+            return encode_cursor(self.object_list[0], BEFORE,
+                                 self.date_field)
+        return None
+
+
+class CursorPaginator:
+    """Постраничный вывод ленты по ключу (дата, id), по умолчанию pub_date.
+
+    Каждая страница — один диапазонный запрос по индексу даты
+    без COUNT(*) и OFFSET, поэтому глубина страницы не влияет на цену.
+    """
+
+    def __init__(self, object_list, per_page, date_field="pub_date"):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.date_field = date_field
+
+    def _page(self, items, has_next, has_previous):
+        return CursorPage(items, has_next, has_previous, self.date_field)
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return self._first_page()
+        direction, date, pk = decoded
+        if direction == AFTER:
+            return self._page_after(date, pk)
+        return self._page_before(date, pk)
+
+    def _first_page(self):
+        items = self._older(None, None, self.per_page + 1)
+        return self._page(items[:self.per_page],
+                          has_next=len(items) > self.per_page,
+                          has_previous=False)
+
+    def _page_after(self, date, pk):
+        items = self._older(date, pk, self.per_page + 1)
+        return self._page(items[:self.per_page],
+                          has_next=len(items) > self.per_page,
+                          has_previous=True)
+
+    def _page_before(self, date, pk):
+        items = self._newer(date, pk, self.per_page + 1)
+        has_previous = len(items) > self.per_page
+        items = items[:self.per_page]
+        items.reverse()
+        return self._page(items, has_next=True, has_previous=has_previous)
+
+    def _older(self, date, pk, limit):
+        """До ``limit`` объектов старше (date, pk), от новых к старым."""
+        field = self.date_field
+        items = self.object_list
+        if date is not None:
+            items = items.filter(Q(**{f"{field}__lt": date})
+                                 | Q(**{field: date, "id__lt": pk}))
+        return list(items.order_by(f"-{field}", "-id")[:limit])
+
+    def _newer(self, date, pk, limit):
+        """До ``limit`` объектов новее (date, pk), от старых к новым."""
+        field = self.date_field
+        return list(self.object_list.filter(
+            Q(**{f"{field}__gt": date}) | Q(**{field: date, "id__gt": pk})
+        ).order_by(field, "id")[:limit])
+
+
+def paginate(request, object_list, per_page=POSTS_PER_PAGE,
+             cursor_paginator=CursorPaginator):
+    """Возвращает (page, paginator) для ленты записей.
+
+    С параметром ``cursor`` лента листается по ключу, иначе — обычными
+    номерами страниц.
+    """
+    cursor = request.GET.get("cursor")
+    if cursor:
+        paginator = cursor_paginator(object_list, per_page)
+        return paginator.get_page(cursor), paginator
+    paginator = Paginator(object_list, per_page)
+    return paginator.get_page(request.GET.get("page")), paginator
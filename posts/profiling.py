@@ -0,0 +1,100 @@
+"""Сэмплирующий профилировщик запросов.
+
+Пока идёт выбранный запрос, отдельный поток раз в PROFILER_INTERVAL
+секунд снимает стек потока запроса через sys._current_frames(). Стеки
+копятся в формате folded («корень;...;лист число»), который понимают
+flamegraph.pl и speedscope: по файлу на представление и процесс в
+PROFILER_DIR/<view>/<pid>.folded. Команда merge_profiles сводит их.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+FOLDED_SUFFIX = ".folded"
+
+
+def sample_rates():
+    return getattr(settings, "PROFILER_SAMPLE_RATES", {})
+
+
+def profiler_dir():
+    return getattr(settings, "PROFILER_DIR",
+                   os.path.join(settings.BASE_DIR, "profiles"))
+
+
+def frame_name(frame):
+    code = frame.f_code
+    filename = os.path.relpath(code.co_filename, settings.BASE_DIR)
+    if filename.startswith(".."):
+        filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def fold(frame):
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame).replace(";", ":"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """Снимает стек потока ``thread_id``, пока не вызван stop()."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+_write_lock = threading.Lock()
+
+
+def save_stacks(view_name, stacks):
+    if not stacks:
+        return
+    directory = os.path.join(profiler_dir(), view_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}{FOLDED_SUFFIX}")
+    with _write_lock, open(path, "a", encoding="utf-8") as output:
+        for stack, count in stacks.items():
+            output.write(f"{stack} {count}\n")
+
+
+def read_folded(path, stacks=None):
+    stacks = Counter() if stacks is None else stacks
+    with open(path, encoding="utf-8") as folded:
+        for line in folded:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+def summarize(stacks, top=15):
+    """(всего сэмплов, топ по собственному времени, топ включительно)."""
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    return (sum(stacks.values()), own.most_common(top),
+            inclusive.most_common(top))
@@ -0,0 +1,147 @@
+"""Планы запросов страниц и подсказки по индексам.
+
+Каждый SELECT, выполненный представлением, прогоняется через
+EXPLAIN QUERY PLAN (SQLite). Полный просмотр таблицы («SCAN t» без
+индекса) и сортировка во временном B-дереве помечаются, а по условиям
+равенства и ORDER BY проблемного запроса предлагается составной индекс,
+если в базе ещё нет индекса с теми же первыми столбцами.
+"""
+import re
+from collections import namedtuple
+
+from django.apps import apps
+from django.db import connections
+
+FULL_SCAN = "полный просмотр"
+TEMP_SORT = "сортировка во временном B-дереве"
+
+Statement = namedtuple("Statement", "alias sql params")
+Finding = namedtuple("Finding", "statement plan problems suggestions")
+
+_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_TABLE_IN_PLAN = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+
+
+class StatementRecorder:
+    """execute_wrapper, запоминающий SELECT-запросы и базу, где они шли."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith("SELECT"):
+            self.statements.append(Statement(
+                context["connection"].alias, sql, tuple(params or ())))
+        return execute(sql, params, many, context)
+
+
+def explain(statement):
+    with connections[statement.alias].cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement.sql}",
+                       statement.params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _columns(sql, table, pattern):
+    return re.findall(rf'"{table}"\."(\w+)"{pattern}', sql)
+
+
+def proposed_columns(sql, table, primary_key):
+    """Столбцы индекса: сначала равенства из WHERE, затем ORDER BY.
+
+    Выборка по первичному ключу индексом не ускорить, а сам ключ (rowid)
+    SQLite и так хранит в конце каждого индекса.
+    """
+    where, _, order = sql.partition(" ORDER BY ")
+    where = where.partition(" WHERE ")[2]
+    columns = []
+    for column in _columns(where, table, r" (?:= |IN \()"):
+        if column == primary_key:
+            return []
+        if column not in columns:
+            columns.append(column)
+    order = order.partition(" LIMIT ")[0]
+    for column, direction in _columns(order, table, r"( DESC| ASC)?"):
+        if column not in columns and column != primary_key:
+            columns.append(("-" if direction == " DESC" else "") + column)
+    return columns
+
+
+def existing_indexes(alias, table):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [info["columns"] for info in constraints.values()
+            if info["index"] or info["unique"] or info["primary_key"]]
+
+
+def is_covered(columns, indexes):
+    """Есть ли индекс с теми же первыми столбцами.
+
+    Направление не важно: SQLite умеет обходить индекс в обратную сторону.
+    """
+    wanted = [column.lstrip("-") for column in columns]
+    return any(index[:len(wanted)] == wanted for index in indexes)
+
+
+def table_model(table):
+    for model in apps.get_models():
+        if model._meta.db_table == table:
+            return model
+    return None
+
+
+def model_index(model, columns):
+    """Поля для Meta.indexes модели по столбцам таблицы."""
+    by_column = {field.column: field.name
+                 for field in model._meta.concrete_fields}
+    fields = []
+    for column in columns:
+        sign = "-" if column.startswith("-") else ""
+        name = by_column.get(column.lstrip("-"))
+        if name is None:
+            return None
+        fields.append(sign + name)
+    return fields
+
+
+def analyze(statement):
+    plan = explain(statement)
+    problems = []
+    tables = []
+    for line in plan:
+        detail = line.strip()
+        scan = _SCAN.match(detail)
+        if scan:
+            problems.append(f"{FULL_SCAN} {scan.group(1)}")
+            tables.append(scan.group(1))
+        elif detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            problems.append(TEMP_SORT)
+            order = statement.sql.partition(" ORDER BY ")[2]
+            tables.extend(table for table in _plan_tables(plan)
+                          if f'"{table}".' in order)
+    suggestions = []
+    for table in dict.fromkeys(tables):
+        model = table_model(table)
+        if model is None:
+            continue
+        columns = proposed_columns(statement.sql, table,
+                                   model._meta.pk.column)
+        if not columns or is_covered(
+                columns, existing_indexes(statement.alias, table)):
+            continue
+        fields = model_index(model, columns)
+        if fields is not None and (model, fields) not in suggestions:
+            suggestions.append((model, fields))
+    return Finding(statement, plan, problems, suggestions)
+
+
+def _plan_tables(plan):
+    return [match.group(1) for match in
+            (_TABLE_IN_PLAN.match(line.strip()) for line in plan) if match]
+
+
+def index_operation(model, fields):
+    """Строка для Meta.indexes модели."""
+    return (f"{model.__name__}: models.Index(fields="
+            f"[{', '.join(repr(field) for field in fields)}])")
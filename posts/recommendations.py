@@ -0,0 +1,229 @@
+"""Рекомендации «кого почитать» по графу подписок.
+
+Оценка автора a для читателя u складывается из двух частей:
+
+* друзья друзей — сколько авторов, на которых подписан u, сами читают a;
+* совместные подписки — читатели v со схожими подписками голосуют за
+  своих авторов с весом сходства sim(u, v) = Σ 1 / читателей(b) по общим
+  авторам b, так что общий популярный автор почти ничего не значит.
+
+Голосуют только SIMILAR_READERS самых похожих читателей (без самого u).
+В матричном виде с матрицей смежности A (читатель × автор) и
+диагональной W = 1 / читателей это A·A + top_k(A·W·Aᵀ)·A. Если
+установлены numpy и scipy, строки считаются разреженными матрицами
+блоками по BLOCK_SIZE читателей, иначе тот же счёт идёт по словарям. Лучшие
+RECOMMENDATIONS_PER_USER авторов хранятся в Recommendation и
+перезаписываются только у тех, у кого список изменился.
+
+Подписка или отписка помечает устаревшими рекомендации самого читателя и
+его читателей и ставит в очередь задачу refresh_stale. Дальние эффекты
+(сходство через общих авторов) догоняет полная пересборка
+``manage.py build_recommendations``.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import feed_cache, jobs
+from .models import Follow, Job, Recommendation, User, UserStats
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+RECOMMENDATIONS_PER_USER = getattr(settings, "RECOMMENDATIONS_PER_USER", 10)
+REFRESH_DELAY = getattr(settings, "RECOMMENDATIONS_REFRESH_DELAY", 60)
+REFRESH_JOB = "posts.recommendations.refresh_stale"
+SIMILAR_READERS = getattr(settings, "RECOMMENDATIONS_SIMILAR_READERS", 100)
+BLOCK_SIZE = 500
+# Округление оценок, чтобы порядок не зависел от способа подсчёта.
+SCORE_DIGITS = 6
+
+
+class FollowGraph:
+    """Подписки в памяти: кого читает пользователь и кто читает автора."""
+
+    def __init__(self, edges):
+        self.following = defaultdict(set)
+        self.followers = defaultdict(set)
+        for user_id, author_id in edges:
+            self.following[user_id].add(author_id)
+            self.followers[author_id].add(user_id)
+        self._matrix = None
+
+    @classmethod
+    def load(cls):
+        return cls(Follow.objects.values_list(
+            "user_id", "author_id").iterator())
+
+    def matrix(self):
+        """(A, W, id вершин, позиция по id) для разреженного подсчёта."""
+        if self._matrix is None:
+            nodes = sorted(set(self.following) | set(self.followers))
+            index = {pk: position for position, pk in enumerate(nodes)}
+            rows, cols = [], []
+            for user_id, authors in self.following.items():
+                rows.extend([index[user_id]] * len(authors))
+                cols.extend(index[author_id] for author_id in authors)
+            size = len(nodes)
+            adjacency = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, cols)), shape=(size, size))
+            readers = np.asarray(adjacency.sum(axis=0)).ravel()
+            weights = sparse.diags(1.0 / np.maximum(readers, 1))
+            self._matrix = (adjacency, weights, np.array(nodes), index)
+        return self._matrix
+
+
+def score_python(graph, user_ids):
+    """Для каждого читателя (id, оценки авторов, число общих подписок)."""
+    for user_id in user_ids:
+        followed = graph.following.get(user_id, ())
+        mutual = Counter()
+        for friend_id in followed:
+            mutual.update(graph.following.get(friend_id, ()))
+        similarity = Counter()
+        for author_id in followed:
+            readers = graph.followers[author_id]
+            for reader_id in readers:
+                similarity[reader_id] += 1 / len(readers)
+        similarity.pop(user_id, None)
+        scores = Counter(mutual)
+        for weight, reader_id in heapq.nsmallest(SIMILAR_READERS, (
+                (-round(weight, SCORE_DIGITS), reader_id)
+                for reader_id, weight in similarity.items())):
+            for author_id in graph.following.get(reader_id, ()):
+                scores[author_id] -= weight
+        yield user_id, scores, mutual
+
+
+def _row(matrix, row, nodes):
+    start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+    return dict(zip(nodes[matrix.indices[start:stop]].tolist(),
+                    matrix.data[start:stop].tolist()))
+
+
+def _keep_similar(similarity, row, nodes, user_id):
+    """Обнуляет в строке всех, кроме SIMILAR_READERS самых похожих."""
+    start, stop = similarity.indptr[row], similarity.indptr[row + 1]
+    data = similarity.data[start:stop]
+    ids = nodes[similarity.indices[start:stop]]
+    data[:] = np.round(data, SCORE_DIGITS)
+    data[ids == user_id] = 0
+    # Как в score_python: по убыванию сходства, при равенстве по id.
+    order = np.lexsort((ids, -data))
+    data[order[SIMILAR_READERS:]] = 0
+
+
+def score_sparse(graph, user_ids):
+    """То же, что score_python, произведениями разреженных матриц."""
+    adjacency, weights, nodes, index = graph.matrix()
+    known = []
+    for user_id in user_ids:
+        if user_id in index:
+            known.append(user_id)
+        else:
+            yield user_id, {}, {}
+    if not known:
+        return
+    picked = adjacency[[index[user_id] for user_id in known]]
+    mutual = (picked @ adjacency).tocsr()
+    similarity = (picked @ weights @ adjacency.T).tocsr()
+    for row, user_id in enumerate(known):
+        _keep_similar(similarity, row, nodes, user_id)
+    similarity.eliminate_zeros()
+    scores = (mutual + similarity @ adjacency).tocsr()
+    for row, user_id in enumerate(known):
+        yield user_id, _row(scores, row, nodes), _row(mutual, row, nodes)
+
+
+def top(graph, user_id, scores, mutual, size=RECOMMENDATIONS_PER_USER):
+    """Лучшие [(автор, оценка, общих подписок)] без себя и уже читаемых."""
+    skip = graph.following.get(user_id, set()) | {user_id}
+    best = heapq.nsmallest(size, (
+        (-round(score, SCORE_DIGITS), author_id)
+        for author_id, score in scores.items()
+        if author_id not in skip and score > 0))
+    return [(author_id, -score, int(mutual.get(author_id, 0)))
+            for score, author_id in best]
+
+
+def build(user_ids, graph=None, vectorized=None):
+    """Пересчитывает рекомендации читателей, возвращает число изменённых."""
+    graph = graph or FollowGraph.load()
+    if vectorized is None:
+        vectorized = sparse is not None
+    scorer = score_sparse if vectorized else score_python
+    changed = 0
+    for start in range(0, len(user_ids), BLOCK_SIZE):
+        block = user_ids[start:start + BLOCK_SIZE]
+        fresh = {user_id: top(graph, user_id, scores, mutual)
+                 for user_id, scores, mutual in scorer(graph, block)}
+        stored = defaultdict(list)
+        for row in Recommendation.objects.filter(
+                user_id__in=block).order_by("user_id", "-score", "author_id"):
+            stored[row.user_id].append(
+                (row.author_id, row.score, row.mutual))
+        updated = [user_id for user_id in block
+                   if fresh[user_id] != stored.get(user_id, [])]
+        if not updated:
+            continue
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=updated).delete()
+            Recommendation.objects.bulk_create(
+                Recommendation(user_id=user_id, author_id=author_id,
+                               score=score, mutual=mutual)
+                for user_id in updated
+                for author_id, score, mutual in fresh[user_id])
+        # Рекомендации видны на собственной странице профиля.
+        feed_cache.invalidate(*[feed_cache.author_scope(user_id)
+                                for user_id in updated])
+        changed += len(updated)
+    return changed
+
+
+def build_all(vectorized=None):
+    UserStats.objects.update(recommendations_stale=False)
+    user_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+    return build(user_ids, vectorized=vectorized)
+
+
+def refresh_stale(vectorized=None):
+    """Пересчитывает помеченных читателей; задача очереди REFRESH_JOB."""
+    user_ids = list(UserStats.objects.filter(
+        recommendations_stale=True).order_by("user_id").values_list(
+        "user_id", flat=True))
+    if not user_ids:
+        return 0
+    graph = FollowGraph.load()
+    changed = 0
+    for start in range(0, len(user_ids), BLOCK_SIZE):
+        block = user_ids[start:start + BLOCK_SIZE]
+        # Снимаем пометку до подсчёта: подписка во время пересчёта
+        # поставит её снова, и читатель попадёт в следующий проход.
+        UserStats.objects.filter(user_id__in=block).update(
+            recommendations_stale=False)
+        changed += build(block, graph, vectorized)
+    return changed
+
+
+def mark_stale(user_id):
+    """Подписки ``user_id`` изменились: его читателям и ему пересчёт."""
+    UserStats.objects.filter(
+        Q(user_id=user_id) | Q(user__follower__author_id=user_id)).update(
+        recommendations_stale=True)
+    # Обычно пересчёт уже в очереди: дешёвая проверка избавляет от
+    # попытки вставки, а гонку двух подписок решает dedup_key.
+    if not Job.objects.filter(dedup_key=REFRESH_JOB,
+                              status=Job.QUEUED).exists():
+        jobs.enqueue(REFRESH_JOB, delay=REFRESH_DELAY, dedup_key=REFRESH_JOB)
+
+
+def for_user(user, size=RECOMMENDATIONS_PER_USER):
+    """Рекомендации без авторов, на которых уже успели подписаться."""
+    return Recommendation.objects.filter(user=user).exclude(
+        author__following__user=user).select_related("author")[:size]
@@ -0,0 +1,93 @@
+"""Чтение с реплик и закрепление за основной базой после записи.
+
+Реплики перечислены в settings.DATABASE_REPLICAS; без них роутер ничего
+не меняет. Чтения уходят на случайную реплику, запись — всегда в
+``default``. Кто только что писал (новая запись, правка, комментарий,
+подписка), тот какое-то время читает из основной базы, чтобы увидеть
+свои изменения, пока реплики догоняют: после записи
+ReplicaPinMiddleware ставит cookie на REPLICA_PIN_SECONDS. Запросы
+небезопасными методами (POST и т. п.) читают из основной базы целиком:
+проверки перед записью не должны видеть отставшую реплику.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PRIMARY = "default"
+PIN_COOKIE = "primary_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+class _State(threading.local):
+    pinned = False
+    wrote = False
+
+
+_state = _State()
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def pin_seconds():
+    return getattr(settings, "REPLICA_PIN_SECONDS", 10)
+
+
+def reset(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def wrote():
+    return _state.wrote
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока — из основной базы."""
+    previous = _state.pinned
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        pool = replicas()
+        if not pool or _state.pinned or _state.wrote:
+            return PRIMARY
+        return random.choice(pool)
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет пользователя за основной базой после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset(pinned=PIN_COOKIE in request.COOKIES
+              or request.method not in SAFE_METHODS)
+        try:
+            response = self.get_response(request)
+            if wrote() and replicas():
+                response.set_cookie(PIN_COOKIE, "1", max_age=pin_seconds(),
+                                    httponly=True, samesite="Lax")
+        finally:
+            reset()
+        return response
@@ -0,0 +1,73 @@
+"""Полнотекстовый поиск по записям.
+
+На SQLite текст записей хранится в таблице FTS5, которая обновляется
+сигналами сохранения и удаления Post. На других СУБД поиск откатывается
+к фильтру по вхождению слов.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = "posts_post_fts"
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def search_posts(query):
+    """Записи, содержащие все слова запроса, от самых релевантных."""
+    terms = _terms(query)
+    if not terms:
+        return Post.objects.none()
+    if not fts_enabled():
+        posts = Post.objects.all()
+        for term in terms:
+            posts = posts.filter(text__icontains=term)
+        return posts
+    match = " ".join(f'"{term}"*' for term in terms)
+    return Post.objects.extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = posts_post.id",
+               f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+        select={"rank": f"{FTS_TABLE}.rank"},
+    ).order_by("rank", "-pub_date")
+
+
+def index_post(post):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                       [post.pk])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, text) "
+                       f"VALUES (%s, %s)", [post.pk, post.text])
+
+
+def unindex_post(post_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                       [post_id])
+
+
+def rebuild_index():
+    """Переиндексирует все записи, возвращает их число."""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, text) "
+                       f"SELECT id, text FROM posts_post")
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) "
+                       f"VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
@@ -0,0 +1,132 @@
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (feed_cache, recommendations, search, stats, timeline,
+               trending)
+from .conditional import forget_owner
+from .models import Comment, Follow, Group, Post, User
+
+# Записи, которые сейчас удаляются вместе со своими комментариями.
+deleting_posts = set()
+
+
+def invalidate_comment_feeds(comment):
+    post = Post.objects.filter(pk=comment.post_id).first()
+    if post is not None:
+        feed_cache.invalidate_post(post, followers=False)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        score = trending.event_score(instance.created,
+                                     trending.COMMENT_WEIGHT)
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=F("comment_count") + 1,
+            trending_score=trending.added(score))
+        invalidate_comment_feeds(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts:
+        return
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F("comment_count") - 1)
+    trending.remove(instance.post_id, instance.created)
+    invalidate_comment_feeds(instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    if instance._state.adding and not instance.trending_score:
+        instance.trending_score = trending.post_score(instance)
+    if instance.pk is not None:
+        instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk).values_list("group_id", flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        stats.increment(instance.author_id, "posts")
+        timeline.fan_out_post(instance)
+    search.index_post(instance)
+    feed_cache.invalidate_post(
+        instance, getattr(instance, "_previous_group_id", None))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # Каскад удаляет комментарии раньше записи: пересчитывать для каждого
+    # счётчик, оценку и кэш лент уже удаляемой записи незачем.
+    deleting_posts.add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts.discard(instance.pk)
+    stats.decrement(instance.author_id, "posts")
+    search.unindex_post(instance.pk)
+    feed_cache.invalidate_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        stats.increment(instance.user_id, "following")
+        stats.increment(instance.author_id, "followers")
+        timeline.backfill(instance.user_id, instance.author_id)
+        recommendations.mark_stale(instance.user_id)
+        feed_cache.invalidate(feed_cache.follow_scope(instance.user_id),
+                              feed_cache.author_scope(instance.author_id),
+                              feed_cache.author_scope(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.decrement(instance.user_id, "following")
+    stats.decrement(instance.author_id, "followers")
+    timeline.trim(instance.user_id, instance.author_id)
+    recommendations.mark_stale(instance.user_id)
+    feed_cache.invalidate(feed_cache.follow_scope(instance.user_id),
+                          feed_cache.author_scope(instance.author_id),
+                          feed_cache.author_scope(instance.user_id))
+
+
+def remember_address(instance, field, update_fields):
+    """Запоминает прежний адрес (slug, username) до сохранения."""
+    instance._previous_address = None
+    if instance.pk is None or (update_fields is not None
+                               and field not in update_fields):
+        return
+    instance._previous_address = type(instance).objects.filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(pre_save, sender=Group)
+def group_changing(sender, instance, update_fields=None, **kwargs):
+    remember_address(instance, "slug", update_fields)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    forget_owner(Group, instance.slug,
+                 getattr(instance, "_previous_address", None))
+    feed_cache.invalidate(feed_cache.GLOBAL)
+
+
+@receiver(pre_save, sender=User)
+def user_changing(sender, instance, update_fields=None, **kwargs):
+    remember_address(instance, "username", update_fields)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_owner(User, instance.username,
+                 getattr(instance, "_previous_address", None))
@@ -0,0 +1,69 @@
+"""Счётчики подписчиков, подписок и записей пользователя.
+
+Поддерживаются сигналами на запись Follow и Post, так что карточка
+автора не выполняет агрегирующих запросов.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Follow, Post, User, UserStats
+
+
+def _count(model, field):
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by().values(
+        field).annotate(total=Count("id")).values("total")
+    return Coalesce(Subquery(rows), 0)
+
+
+def rebuild(user_id):
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            "followers": Follow.objects.filter(author_id=user_id).count(),
+            "following": Follow.objects.filter(user_id=user_id).count(),
+            "posts": Post.objects.filter(author_id=user_id).count(),
+        })
+    return stats
+
+
+def increment(user_id, field):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + 1})
+    if not updated:
+        rebuild(user_id)
+
+
+def decrement(user_id, field):
+    UserStats.objects.filter(user_id=user_id, **{f"{field}__gt": 0}).update(
+        **{field: F(field) - 1})
+
+
+def get_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return rebuild(user.pk)
+
+
+def rebuild_all(batch_size=1000):
+    """Пересобирает счётчики всех пользователей, возвращает их число."""
+    rows = User.objects.annotate(
+        n_followers=_count(Follow, "author"),
+        n_following=_count(Follow, "user"),
+        n_posts=_count(Post, "author"),
+    ).values_list("pk", "n_followers", "n_following", "n_posts")
+    total = 0
+    with transaction.atomic():
+        UserStats.objects.all().delete()
+        batch = []
+        for user_id, followers, following, posts in rows.iterator():
+            batch.append(UserStats(user_id=user_id, followers=followers,
+                                   following=following, posts=posts))
+            if len(batch) >= batch_size:
+                UserStats.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        UserStats.objects.bulk_create(batch)
+        total += len(batch)
+    return total
@@ -0,0 +1,48 @@
+from django import template
+
+from ..paginators import AFTER, BEFORE, CursorPage, encode_cursor
+from ..thumbnails import cached_card_thumbnail
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page):
+    if isinstance(page, CursorPage):
+        return page.next_cursor
+    if page.has_next():
+        return encode_cursor(page[len(page) - 1], AFTER)
+    return None
+
+
+@register.filter
+def previous_cursor(page):
+    if isinstance(page, CursorPage):
+        return page.previous_cursor
+    if page.has_previous():
+        return encode_cursor(page[0], BEFORE)
+    return None
+
+
+@register.filter
+def is_cursor_page(page):
+    return isinstance(page, CursorPage)
+
+
+@register.simple_tag
+def card_thumbnail(image, geometry):
+    return cached_card_thumbnail(image, geometry)
+
+
+@register.filter
+def srcset(variants, format_):
+    return ", ".join(f"{variant.image.url} {variant.width}w"
+                     for variant in variants if variant.format == format_)
+
+
+@register.filter
+def largest_variant_url(variants):
+    jpegs = [variant for variant in variants if variant.format == "JPEG"]
+    if jpegs:
+        return max(jpegs, key=lambda variant: variant.width).image.url
+    return ""
@@ -0,0 +1,39 @@
+"""Проверка бюджета запросов к БД для маршрутов posts.urls."""
+from .middleware import QueryRecorder
+
+# Бюджеты с учётом сессии и пользователя; страницы лент не должны
+# зависеть от числа карточек. Группа, профиль и запись включают поиск
+# id по адресу для условного GET (при холодном кэше). Лента подписок
+# сначала берёт ключи страницы из TimelineEntry, затем записи по id.
+QUERY_BUDGETS = {
+    "index": 5,
+    "trending": 5,
+    "group_posts": 7,
+    "search": 5,
+    "new_post": 3,
+    "follow_index": 8,
+    "profile": 9,
+    "post": 6,
+    "post_comments": 5,
+    "post_edit": 5,
+    "add_comment": 8,
+    "profile_follow": 7,
+    "profile_unfollow": 11,
+}
+
+
+class QueryBudgetMixin:
+    """Примесь к TestCase: запрос страницы с проверкой числа запросов."""
+
+    def assertQueryBudget(self, client, route, url, method="get", **kwargs):
+        budget = QUERY_BUDGETS[route]
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = getattr(client, method)(url, **kwargs)
+        if recorder.count > budget:
+            statements = "\n".join(
+                f"{total}x {sql}"
+                for (sql, _), total in recorder.statements.most_common())
+            self.fail(f"{route}: {recorder.count} запросов при бюджете "
+                      f"{budget}\n{statements}")
+        return response
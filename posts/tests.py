@@ -1,9 +1,36 @@
-from django.test import TestCase, Client, override_settings
+from django.test import (TestCase, TransactionTestCase, Client,
+                         RequestFactory, override_settings)
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 import io
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-from .models import User, Post, Group, Follow, Comment
+from . import (conditional, feed_cache, forms, jobs, recommendations, routers,
+               thumbnails, timeline, trending)
+from .cache_backends import SQLiteCache
+from .models import (User, Post, Group, Follow, Comment, Job, TimelineEntry,
+                     UserStats, PostImageVariant, Recommendation)
+from .paginators import POSTS_PER_PAGE, CursorPage, decode_cursor
+from .query_plans import StatementRecorder, analyze
+from .search import search_posts
+from .middleware import (SamplingProfilerMiddleware, page_cache_stats,
+                         view_query_stats)
+from .testing import QUERY_BUDGETS, QueryBudgetMixin
+from . import urls as posts_urls
+from .templatetags.post_filters import next_cursor
 from yatube.settings import CACHES
 
 CACHE = {
@@ -98,6 +125,24 @@ class ProfileTest(TestCase):
         for url in urls_list:
             self.contains(url, self.user, text, group)
 
+    @override_settings(CACHES=CACHE)
+    def test_post_edit_keeps_concurrent_comment_count(self):
+        post = Post.objects.create(author=self.user, text="Текст")
+        original = forms.PostForm.is_valid
+
+        def comment_while_editing(form):
+            Comment.objects.create(post=post, author=self.user, text="к")
+            return original(form)
+
+        with mock.patch.object(forms.PostForm, "is_valid", autospec=True,
+                               side_effect=comment_while_editing):
+            self.client_login.post(
+                reverse("post_edit", args=[self.user.username, post.pk]),
+                {"text": "Новый текст"})
+        post.refresh_from_db()
+        self.assertEqual(post.text, "Новый текст")
+        self.assertEqual(post.comment_count, 1)
+
     def test_404_code(self):
         response = self.client_logout.get('/400/ ')
         self.assertEqual(response.status_code, 404)
@@ -149,14 +194,17 @@ class ProfileTest(TestCase):
     def test_cache(self):
         text = "Приличный текст"
         text_new = "НЕприличный текст"
-        Post.objects.create(author=self.user, group=self.group,
-                            text=text)
+        post = Post.objects.create(author=self.user, group=self.group,
+                                   text=text)
         response = self.client_login.get(reverse("index"))
         self.assertContains(response, text)
+        Post.objects.filter(pk=post.pk).update(text=text_new)
+        response_cached = self.client_login.get(reverse("index"))
+        self.assertNotContains(response_cached, text_new)
         Post.objects.create(author=self.user, group=self.group,
                             text=text_new)
         response_new = self.client_login.get(reverse("index"))
-        self.assertNotContains(response_new, text_new)
+        self.assertContains(response_new, text_new, count=2)
 
     def test_auth_user_can_follow(self):
         author = User.objects.create_user(username="arni")
@@ -214,3 +262,1259 @@ class ProfileTest(TestCase):
         self.assertEqual(Comment.objects.first().post, post)
         self.assertEqual(post.comments.first().text, "test")
         self.assertEqual(post.comments.first().author, self.user)
+
+
+@override_settings(CACHES=CACHE)
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+        self.posts = [Post.objects.create(author=self.user, text=f"пост {i}")
+                      for i in range(25)]
+
+    def walk(self, url):
+        response = self.client_login.get(url)
+        seen = [post.pk for post in response.context["page"]]
+        cursor = next_cursor(response.context["page"])
+        while cursor:
+            response = self.client_login.get(url, {"cursor": cursor})
+            page = response.context["page"]
+            self.assertIsInstance(page, CursorPage)
+            seen += [post.pk for post in page]
+            cursor = page.next_cursor
+        return seen, response
+
+    def test_cursor_walks_whole_feed(self):
+        expected = [post.pk for post in reversed(self.posts)]
+        for url in [reverse("index"),
+                    reverse("profile", args=[self.user.username])]:
+            seen, _ = self.walk(url)
+            self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        _, response = self.walk(reverse("index"))
+        last_page = response.context["page"]
+        response = self.client_login.get(
+            reverse("index"), {"cursor": last_page.previous_cursor})
+        page = response.context["page"]
+        self.assertEqual([post.pk for post in page],
+                         [post.pk for post in reversed(self.posts[5:15])])
+        self.assertTrue(page.has_previous())
+
+    def test_broken_cursor_gives_first_page(self):
+        self.assertIsNone(decode_cursor("мусор"))
+        response = self.client_login.get(reverse("index"),
+                                         {"cursor": "bm90LWEtY3Vyc29y"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["page"][0], self.posts[-1])
+
+    def test_cursor_page_skips_count_and_offset(self):
+        cursor = next_cursor(self.client_login.get(
+            reverse("index")).context["page"])
+        with CaptureQueriesContext(connection) as queries:
+            self.client_login.get(reverse("index"), {"cursor": cursor})
+        sql = " ".join(query["sql"] for query in queries).upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+
+@override_settings(CACHES=CACHE)
+class CommentCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.post = Post.objects.create(author=self.user, text="test")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+
+    def test_add_and_delete_comment_update_counter(self):
+        self.client_login.post(
+            reverse("add_comment", args=[self.user, self.post.pk]),
+            {"text": "первый"})
+        comment = Comment.objects.create(post=self.post, author=self.user,
+                                         text="второй")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_recount_command_repairs_counter(self):
+        Comment.objects.create(post=self.post, author=self.user, text="а")
+        Post.objects.update(comment_count=42)
+        call_command("recount_comments", stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_feed_has_no_per_card_comment_queries(self):
+        for i in range(5):
+            post = Post.objects.create(author=self.user, text=f"пост {i}")
+            Comment.objects.create(post=post, author=self.user, text="к")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_login.get(reverse("index"))
+        self.assertContains(response, "1 комментариев", count=5)
+        self.assertFalse(any("posts_comment" in query["sql"]
+                             for query in queries))
+
+
+@override_settings(CACHES=CACHE)
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.author = User.objects.create_user(username="arni")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text="свежий")
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=post, pub_date=post.pub_date).exists())
+        response = self.client_login.get(reverse("follow_index"))
+        self.assertEqual(list(response.context["page"]), [post])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        old = Post.objects.create(author=self.author, text="старый")
+        self.client_login.get(reverse("profile_follow",
+                                      args=[self.author.username]))
+        self.assertEqual(
+            list(self.user.timeline.values_list("post", flat=True)), [old.pk])
+        self.client_login.get(reverse("profile_unfollow",
+                                      args=[self.author.username]))
+        self.assertFalse(self.user.timeline.exists())
+
+    def test_popular_author_posts_are_pulled(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 0):
+            post = Post.objects.create(author=self.author, text="звезда")
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+            response = self.client_login.get(reverse("follow_index"))
+        self.assertEqual(list(response.context["page"]), [post])
+
+    def test_count_skips_entries_of_pulled_authors(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text="разложен")
+        feed = timeline.Timeline(self.user, [self.author.pk])
+        self.assertEqual(feed.count(), 1)
+        self.assertEqual(feed[0:POSTS_PER_PAGE], [post])
+
+    def test_crossing_fanout_limit_moves_author_posts(self):
+        reader = User.objects.create_user(username="reader")
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 1):
+            Follow.objects.create(user=self.user, author=self.author)
+            old = Post.objects.create(author=self.author, text="старый")
+            follow = Follow.objects.create(user=reader, author=self.author)
+            self.assertFalse(TimelineEntry.objects.exists())
+            new = Post.objects.create(author=self.author, text="новый")
+            follow.delete()
+        self.assertEqual(
+            set(self.user.timeline.values_list("post", flat=True)),
+            {old.pk, new.pk})
+
+    def test_fan_out_caps_timeline(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        with mock.patch.object(timeline, "TIMELINE_LENGTH", 2), \
+                mock.patch.object(timeline, "TRIM_EVERY", 1):
+            posts = [Post.objects.create(author=self.author, text=str(number))
+                     for number in range(4)]
+        self.assertEqual(
+            list(self.user.timeline.order_by("-pub_date", "-post").values_list(
+                "post", flat=True)), [posts[3].pk, posts[2].pk])
+
+    def test_cursor_pages_merge_pulled_authors(self):
+        star = User.objects.create_user(username="star")
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=star)
+        Follow.objects.create(user=self.author, author=star)
+        with mock.patch.object(timeline, "FANOUT_LIMIT", 1):
+            for number in range(POSTS_PER_PAGE + 3):
+                Post.objects.create(author=star if number % 2 else self.author,
+                                    text=str(number))
+        # Одинаковые даты: порядок решает id, и в ленте, и в записях.
+        moment = timezone.now()
+        Post.objects.update(pub_date=moment)
+        TimelineEntry.objects.update(pub_date=moment)
+        self.assertEqual(self.user.timeline.count(), 7)
+        paginator = timeline.TimelineCursorPaginator(
+            timeline.Timeline(self.user, [star.pk]), POSTS_PER_PAGE)
+        first = paginator.get_page(None)
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(list(first) + list(second),
+                         list(Post.objects.order_by("-pk")))
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(second.has_next())
+
+    def test_page_is_a_timeline_range_scan(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(author=self.author, text="свежий")
+        with CaptureQueriesContext(connection) as queries:
+            list(timeline.TimelineCursorPaginator(
+                timeline.Timeline(self.user, []), POSTS_PER_PAGE).get_page(
+                None))
+        entries = [query["sql"] for query in queries
+                   if "posts_timelineentry" in query["sql"]]
+        self.assertEqual(len(entries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {entries[0]}")
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+@override_settings(CACHES=CACHE)
+class UserStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.author = User.objects.create_user(username="arni")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.author, text="test")
+        Post.objects.create(author=self.author, text="test 2")
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual((self.author.stats.followers,
+                          self.author.stats.posts), (1, 2))
+        self.assertEqual(self.user.stats.following, 1)
+        post.delete()
+        Follow.objects.all().delete()
+        self.author.stats.refresh_from_db()
+        self.user.stats.refresh_from_db()
+        self.assertEqual((self.author.stats.followers,
+                          self.author.stats.posts), (0, 1))
+        self.assertEqual(self.user.stats.following, 0)
+
+    def test_author_card_has_no_aggregate_queries(self):
+        Post.objects.create(author=self.author, text="test")
+        Follow.objects.create(user=self.user, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_login.get(
+                reverse("profile", args=[self.author.username]))
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertEqual(response.context["post_count"], 1)
+        follow_counts = [query["sql"] for query in queries
+                         if "COUNT(" in query["sql"].upper()
+                         and "posts_follow" in query["sql"]]
+        self.assertEqual(follow_counts, [])
+
+    def test_rebuild_command(self):
+        Post.objects.create(author=self.author, text="test")
+        UserStats.objects.update(posts=10)
+        call_command("rebuild_user_stats", stdout=io.StringIO())
+        self.assertEqual(UserStats.objects.get(user=self.author).posts, 1)
+        self.assertEqual(UserStats.objects.get(user=self.user).posts, 0)
+
+
+class FeedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="sarah")
+        self.group = Group.objects.create(title="Test group",
+                                          slug="testgroup",
+                                          description="Тестовая группа")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+        for i in range(15):
+            Post.objects.create(author=self.user, group=self.group,
+                                text=f"пост номер {i}")
+
+    def test_pages_are_cached_separately(self):
+        first = self.client_login.get(reverse("index"))
+        second = self.client_login.get(reverse("index"), {"page": 2})
+        self.assertContains(first, "пост номер 14")
+        self.assertNotContains(second, "пост номер 14")
+        self.assertContains(second, "пост номер 0")
+
+    def test_comment_invalidates_feeds_except_followers(self):
+        author = User.objects.create_user(username="arni")
+        post = Post.objects.create(author=author, group=self.group,
+                                   text="обсуждаемый")
+        Follow.objects.create(user=self.user, author=author)
+        urls = [reverse("index"),
+                reverse("group_posts", args=[self.group.slug]),
+                reverse("profile", args=[author.username])]
+        for url in urls:
+            self.client_login.get(url)
+        follow = feed_cache.follow_scope(self.user.pk)
+        version = feed_cache.get_versions(follow)
+        Comment.objects.create(post=post, author=self.user, text="к")
+        for url in urls:
+            self.assertContains(self.client_login.get(url), "1 комментариев")
+        self.assertEqual(feed_cache.get_versions(follow), version)
+        post.text = "исправленный"
+        post.save()
+        self.assertNotEqual(feed_cache.get_versions(follow), version)
+
+    def test_group_edit_invalidates_cards(self):
+        self.client_login.get(reverse("index"))
+        self.group.title = "Новое имя"
+        self.group.save()
+        self.assertContains(self.client_login.get(reverse("index")),
+                            "#Новое имя")
+
+    def test_moving_post_invalidates_previous_group(self):
+        url = reverse("group_posts", args=[self.group.slug])
+        self.client_login.get(url)
+        post = Post.objects.first()
+        post.group = Group.objects.create(title="Другая", slug="other",
+                                          description="другая")
+        post.save()
+        self.assertNotContains(self.client_login.get(url), post.text)
+
+
+@override_settings(CACHES=CACHE)
+class SearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.cats = Post.objects.create(author=self.user,
+                                        text="Коты любят спать на солнце")
+        self.dogs = Post.objects.create(author=self.user,
+                                        text="Собаки любят гулять")
+
+    def test_search_finds_words_and_prefixes(self):
+        self.assertEqual(list(search_posts("коты")), [self.cats])
+        self.assertEqual(set(search_posts("люб")), {self.cats, self.dogs})
+        self.assertEqual(list(search_posts("собаки спать")), [])
+        self.assertEqual(list(search_posts('"* OR')), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.cats.text = "Кошки"
+        self.cats.save()
+        self.assertEqual(list(search_posts("коты")), [])
+        self.assertEqual(list(search_posts("кошки")), [self.cats])
+        self.dogs.delete()
+        self.assertEqual(list(search_posts("собаки")), [])
+
+    def test_search_view(self):
+        response = self.client.get(reverse("search"), {"q": "солнце"})
+        self.assertEqual(list(response.context["page"]), [self.cats])
+        self.assertContains(response, self.cats.text)
+
+    def test_reindex_command(self):
+        Post.objects.filter(pk=self.dogs.pk).update(text="Попугаи")
+        call_command("reindex_posts", stdout=io.StringIO())
+        self.assertEqual(list(search_posts("попугаи")), [self.dogs])
+
+    def test_admin_search_uses_index(self):
+        from django.contrib.admin.sites import site
+        post_admin = site._registry[Post]
+        found, _ = post_admin.get_search_results(None, Post.objects.all(),
+                                                 "гулять")
+        self.assertEqual(list(found), [self.dogs])
+
+
+@override_settings(CACHES=CACHE)
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+
+    def image(self):
+        return SimpleUploadedFile(
+            name="test_img.jpg",
+            content=ProfileTest.generate_1x1_grayscale_jpg_file(),
+            content_type="image/jpeg")
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        post = Post.objects.create(author=self.user, text="с картинкой",
+                                   image=self.image())
+        response = self.client_login.get(reverse("index"))
+        self.assertContains(response, "card-placeholder.svg")
+        thumbnails.generate(post.pk)
+        ready = thumbnails.cached_card_thumbnail(post.image, "960x339")
+        self.assertIsNotNone(ready)
+        response = self.client_login.get(reverse("index"))
+        self.assertNotContains(response, "card-placeholder.svg")
+        self.assertContains(response, ready.url)
+
+    def test_cached_lookup_uses_sorl_thumbnail_name(self):
+        post = Post.objects.create(author=self.user, text="с картинкой",
+                                   image=self.image())
+        options = {"crop": "center", "format": "WEBP"}
+        self.assertIsNone(thumbnails.backend.get_cached_thumbnail(
+            post.image, "320x113", **options))
+        built = thumbnails.backend.get_thumbnail(post.image, "320x113",
+                                                 **options)
+        self.assertEqual(thumbnails.backend.get_cached_thumbnail(
+            post.image, "320x113", **options).name, built.name)
+
+    def test_variants_are_recorded_and_rendered(self):
+        post = Post.objects.create(author=self.user, text="с картинкой",
+                                   image=self.image())
+        thumbnails.generate(post.pk)
+        variants = PostImageVariant.objects.filter(post=post)
+        self.assertEqual(
+            sorted(variants.values_list("width", "format")),
+            [(width, format_) for width in thumbnails.VARIANT_WIDTHS
+             for format_ in sorted(thumbnails.VARIANT_FORMATS)])
+        webp = variants.get(width=320, format="WEBP")
+        self.assertTrue(webp.image.name.endswith(".webp"))
+        self.assertEqual(webp.height, 113)
+        response = self.client_login.get(reverse("index"))
+        self.assertContains(response, "<picture>")
+        self.assertContains(response, f"{webp.image.url} 320w")
+
+    def test_new_post_enqueues_generation(self):
+        with mock.patch.object(thumbnails, "enqueue") as enqueue:
+            self.client_login.post(reverse("new_post"),
+                                   {"text": "с картинкой",
+                                    "image": self.image()})
+        enqueue.assert_called_once_with(Post.objects.get())
+
+
+@override_settings(CACHES=CACHE)
+class ExportImportTest(TestCase):
+    def test_round_trip(self):
+        user = User.objects.create_user(username="sarah")
+        author = User.objects.create_user(username="arni")
+        group = Group.objects.create(title="Test group", slug="testgroup",
+                                     description="Тестовая группа")
+        post = Post.objects.create(author=author, group=group,
+                                   text="перенесённый пост")
+        Comment.objects.create(post=post, author=user, text="комментарий")
+        Follow.objects.create(user=user, author=author)
+        pub_date = post.pub_date
+
+        dump = io.StringIO()
+        call_command("export_posts", stdout=dump, stderr=io.StringIO())
+        lines = dump.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+        with mock.patch("sys.stdin", io.StringIO(dump.getvalue())):
+            call_command("import_posts", "--batch-size", "1",
+                         stdout=io.StringIO())
+
+        post = Post.objects.get()
+        self.assertEqual((post.text, post.author.username, post.group.slug),
+                         ("перенесённый пост", "arni", "testgroup"))
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.comments.get().author.username, "sarah")
+        follow = Follow.objects.get()
+        self.assertEqual(follow.author.stats.followers, 1)
+        self.assertTrue(follow.user.timeline.filter(post=post).exists())
+        self.assertEqual(list(search_posts("перенесённый")), [post])
+
+    def test_import_into_non_empty_database(self):
+        user = User.objects.create_user(username="sarah")
+        author = User.objects.create_user(username="arni")
+        old = Post.objects.create(author=author, text="старый пост")
+        Comment.objects.create(post=old, author=user, text="комментарий")
+        Follow.objects.create(user=user, author=author)
+        dump = io.StringIO()
+        call_command("export_posts", stdout=dump, stderr=io.StringIO())
+
+        with mock.patch("sys.stdin", io.StringIO(dump.getvalue())):
+            call_command("import_posts", stdout=io.StringIO())
+
+        imported = Post.objects.exclude(pk=old.pk).get()
+        self.assertEqual((imported.text, imported.comment_count),
+                         ("старый пост", 1))
+        old.refresh_from_db()
+        self.assertEqual(old.comment_count, 1)
+        self.assertEqual(
+            set(user.timeline.values_list("post", flat=True)),
+            {old.pk, imported.pk})
+        newest = Post.objects.create(author=author, text="после загрузки")
+        self.assertGreater(newest.pk, imported.pk)
+
+
+@override_settings(CACHES=CACHE)
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.group = Group.objects.create(title="Test group",
+                                          slug="testgroup",
+                                          description="Тестовая группа")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+        authors = [User.objects.create_user(username=f"author{i}")
+                   for i in range(12)]
+        for author in authors:
+            Follow.objects.create(user=self.user, author=author)
+            post = Post.objects.create(author=author, group=self.group,
+                                       text="поиск")
+            Comment.objects.create(post=post, author=author, text="к")
+        self.post = Post.objects.create(author=self.user, group=self.group,
+                                        text="свой пост")
+        for author in authors:
+            Comment.objects.create(post=self.post, author=author, text="к")
+        self.author = authors[0]
+
+    def test_every_route_has_budget(self):
+        names = {pattern.name for pattern in posts_urls.urlpatterns}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_routes_fit_budgets(self):
+        post_args = [self.user.username, self.post.pk]
+        cases = [
+            ("index", reverse("index"), "get", {}),
+            ("trending", reverse("trending"), "get", {}),
+            ("group_posts", reverse("group_posts", args=["testgroup"]),
+             "get", {}),
+            ("search", reverse("search"), "get", {"data": {"q": "поиск"}}),
+            ("new_post", reverse("new_post"), "get", {}),
+            ("follow_index", reverse("follow_index"), "get", {}),
+            ("profile", reverse("profile", args=[self.author.username]),
+             "get", {}),
+            ("post", reverse("post", args=post_args), "get", {}),
+            ("post_comments", reverse("post_comments", args=post_args),
+             "get", {}),
+            ("post_edit", reverse("post_edit", args=post_args), "get", {}),
+            ("add_comment", reverse("add_comment", args=post_args), "post",
+             {"data": {"text": "ещё"}}),
+            ("profile_follow",
+             reverse("profile_follow", args=["author1"]), "get", {}),
+            ("profile_unfollow",
+             reverse("profile_unfollow", args=["author1"]), "get", {}),
+        ]
+        for route, url, method, kwargs in cases:
+            with self.subTest(route=route):
+                response = self.assertQueryBudget(
+                    self.client_login, route, url, method, **kwargs)
+                self.assertIn(response.status_code, (200, 302))
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers_and_stats(self):
+        view_query_stats.reset()
+        response = self.client_login.get(reverse("index"))
+        self.assertEqual(response["X-View-Name"], "index")
+        self.assertGreater(int(response["X-DB-Query-Count"]), 0)
+        self.assertIn("X-DB-Time-Ms", response)
+        self.assertEqual(response["X-DB-Duplicate-Queries"], "0")
+        stats = view_query_stats.snapshot()["index"]
+        self.assertEqual(stats["requests"], 1)
+        self.assertEqual(stats["queries"],
+                         int(response["X-DB-Query-Count"]))
+
+
+class PostQuerySetTest(TestCase):
+    def test_for_cards_query_count_does_not_grow(self):
+        user = User.objects.create_user(username="sarah")
+        group = Group.objects.create(title="Test group", slug="testgroup",
+                                     description="Тестовая группа")
+        Post.objects.create(author=user, group=group, text="один")
+        with self.assertNumQueries(2):
+            posts = list(Post.objects.for_cards())
+            [(post.author.username, post.group.slug, post.comment_count,
+              list(post.image_variants.all())) for post in posts]
+        for i in range(9):
+            author = User.objects.create_user(username=f"author{i}")
+            Post.objects.create(author=author, group=group, text="ещё")
+        with self.assertNumQueries(2):
+            posts = list(Post.objects.for_cards())
+            [(post.author.username, post.group.slug, post.comment_count,
+              list(post.image_variants.all())) for post in posts]
+        self.assertIn("password", posts[0].author.get_deferred_fields())
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="sarah")
+        self.group = Group.objects.create(title="Test group",
+                                          slug="testgroup",
+                                          description="Тестовая группа")
+        self.posts = [Post.objects.create(author=self.user, group=self.group,
+                                          text=f"пост {i}")
+                      for i in range(12)]
+
+    def test_cursor_pagination_and_fields(self):
+        response = self.client.get(reverse("api_posts"),
+                                   {"fields": "id,author"})
+        data = response.json()
+        self.assertEqual(data["results"][0],
+                         {"id": self.posts[-1].pk, "author": "sarah"})
+        self.assertIsNone(data["previous"])
+        data = self.client.get(reverse("api_posts"),
+                               {"cursor": data["next"]}).json()
+        self.assertEqual([item["id"] for item in data["results"]],
+                         [self.posts[1].pk, self.posts[0].pk])
+        self.assertEqual(data["results"][0]["group"], "testgroup")
+        self.assertIsNone(data["next"])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse("api_posts"), {"fields": "secret"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_not_modified_without_post_queries(self):
+        url = reverse("api_group_posts", args=[self.group.slug])
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any("posts_post" in query["sql"]
+                             for query in queries))
+        Comment.objects.create(post=self.posts[0], author=self.user,
+                               text="к")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_post_and_comments_not_modified_without_queries(self):
+        post = self.posts[0]
+        for name in ("api_post", "api_comments"):
+            url = reverse(name, args=[post.pk])
+            etag = self.client.get(url)["ETag"]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(queries.captured_queries, [])
+        Comment.objects.create(post=post, author=self.user, text="к")
+        response = self.client.get(reverse("api_comments", args=[post.pk]),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        urls = [reverse(name, args=[post.pk])
+                for name in ("api_post", "api_comments")]
+        post.delete()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_comments_and_follow_feed(self):
+        Comment.objects.create(post=self.posts[0], author=self.user,
+                               text="первый")
+        data = self.client.get(
+            reverse("api_comments", args=[self.posts[0].pk])).json()
+        self.assertEqual([item["text"] for item in data["results"]],
+                         ["первый"])
+        self.assertEqual(self.client.get(reverse("api_follow")).status_code,
+                         401)
+        reader = User.objects.create_user(username="reader")
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        data = self.client.get(reverse("api_follow")).json()
+        self.assertEqual(len(data["results"]), 10)
+        # Счётчик комментариев в ленте подписок не сверяется по ETag.
+        self.assertNotIn("comments", data["results"][0])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="sarah")
+        self.post = Post.objects.create(author=self.user, text="пост")
+        self.url = reverse("post", args=[self.user.username, self.post.pk])
+
+    def test_not_modified_without_post_queries(self):
+        response = self.client.get(self.url)
+        self.assertIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any("posts_post" in query["sql"]
+                             for query in queries))
+
+    def test_comment_and_follow_change_validators(self):
+        etag = self.client.get(self.url)["ETag"]
+        Comment.objects.create(post=self.post, author=self.user, text="к")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        profile_url = reverse("profile", args=[self.user.username])
+        etag = self.client.get(profile_url)["ETag"]
+        Follow.objects.create(
+            user=User.objects.create_user(username="reader"),
+            author=self.user)
+        response = self.client.get(profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        etag = self.client.get(reverse("index"))["ETag"]
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("index"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_login_changes_etag_of_page_with_form(self):
+        self.user.set_password("secret")
+        self.user.save()
+        login_url = reverse("login")
+        self.client.post(login_url, {"username": "sarah",
+                                     "password": "secret"})
+        etag = self.client.get(self.url)["ETag"]
+        self.client.logout()
+        self.client.post(login_url, {"username": "sarah",
+                                     "password": "secret"})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_group_is_not_found(self):
+        response = self.client.get(reverse("group_posts", args=["nope"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_renamed_group_address_is_forgotten(self):
+        group = Group.objects.create(title="Группа", slug="old",
+                                     description="группа")
+        self.client.get(reverse("group_posts", args=["old"]))
+        group.slug = "new"
+        group.save()
+        self.assertIsNone(conditional.group_scopes("old"))
+        self.assertEqual(
+            self.client.get(reverse("group_posts", args=["old"])).status_code,
+            404)
+
+
+def _incr_shared(path, times):
+    shared = SQLiteCache(path, {})
+    for _ in range(times):
+        shared.incr("counter")
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+        self.cache = SQLiteCache(self.path, {})
+
+    def test_tests_do_not_use_server_cache(self):
+        self.assertNotIsInstance(caches["default"], SQLiteCache)
+
+    def test_basic_operations(self):
+        self.cache.set("a", {"x": 1})
+        self.cache.set_many({"b": 2, "c": 3})
+        self.assertEqual(self.cache.get("a"), {"x": 1})
+        self.assertEqual(self.cache.get_many(["a", "b", "missing"]),
+                         {"a": {"x": 1}, "b": 2})
+        self.assertFalse(self.cache.add("b", 5))
+        self.assertTrue(self.cache.add("d", 5))
+        self.assertEqual(self.cache.incr("d", 2), 7)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+        self.cache.delete("a")
+        self.assertFalse(self.cache.has_key("a"))
+        self.cache.set("gone", 1, timeout=0)
+        self.assertIsNone(self.cache.get("gone"))
+
+    def test_least_recently_used_are_culled(self):
+        small = SQLiteCache(self.path, {"OPTIONS": {
+            "MAX_ENTRIES": 10, "CULL_FREQUENCY": 2, "CULL_EVERY": 1}})
+        for i in range(10):
+            small.set(f"key{i}", i)
+        with mock.patch("posts.cache_backends.ACCESS_RESOLUTION", 0):
+            small.get("key0")
+        small.set("key10", 10)
+        self.assertEqual(small.get("key0"), 0)
+        self.assertIsNone(small.get("key1"))
+
+    def test_incr_is_shared_between_processes(self):
+        self.cache.set("counter", 0)
+        processes = [multiprocessing.Process(target=_incr_shared,
+                                             args=(self.path, 50))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get("counter"), 150)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.router.db_for_read(Post), "replica")
+        with routers.use_primary():
+            self.assertEqual(self.router.db_for_read(Post), "default")
+        self.assertEqual(self.router.db_for_write(Post), "default")
+        self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_writer_is_pinned_to_primary(self):
+        reads = []
+
+        def write_view(request):
+            self.router.db_for_write(Post)
+            return HttpResponse()
+
+        def read_view(request):
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = routers.ReplicaPinMiddleware(write_view)(
+            self.factory.post("/"))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]["max-age"], 10)
+        middleware = routers.ReplicaPinMiddleware(read_view)
+        self.factory.cookies[routers.PIN_COOKIE] = "1"
+        middleware(self.factory.get("/"))
+        del self.factory.cookies[routers.PIN_COOKIE]
+        response = middleware(self.factory.get("/"))
+        self.assertEqual(reads, ["default", "replica"])
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_unsafe_methods_read_from_primary(self):
+        reads = []
+
+        def read_view(request):
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        middleware = routers.ReplicaPinMiddleware(read_view)
+        middleware(self.factory.post("/"))
+        middleware(self.factory.delete("/"))
+        middleware(self.factory.head("/"))
+        self.assertEqual(reads, ["default", "default", "replica"])
+
+
+class CommentPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.post = Post.objects.create(author=self.user, text="пост")
+        self.comments = [Comment.objects.create(post=self.post,
+                                                author=self.user,
+                                                text=f"комментарий {i}")
+                         for i in range(25)]
+        self.args = [self.user.username, self.post.pk]
+
+    def test_post_page_shows_first_chunk(self):
+        response = self.client.get(reverse("post", args=self.args))
+        comments = response.context["comments"]
+        self.assertEqual([comment.pk for comment in comments],
+                         [comment.pk for comment in self.comments[:4:-1]])
+        self.assertTrue(response.context["comment_page"].has_next())
+        self.assertContains(response, reverse("post_comments",
+                                              args=self.args))
+
+    def test_chunk_returns_older_comments(self):
+        page = self.client.get(reverse("post", args=self.args)).context[
+            "comment_page"]
+        response = self.client.get(reverse("post_comments", args=self.args),
+                                   {"cursor": next_cursor(page)})
+        self.assertEqual([comment.pk for comment in response.context[
+            "comments"]], [comment.pk for comment in self.comments[4::-1]])
+        self.assertNotContains(response, "Показать ещё")
+        self.assertNotContains(response, "<html")
+
+    def test_chunk_for_foreign_post_is_not_found(self):
+        other = User.objects.create_user(username="other")
+        response = self.client.get(
+            reverse("post_comments", args=[other.username, self.post.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SyndicationFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="sarah")
+        self.group = Group.objects.create(title="Test group",
+                                          slug="testgroup",
+                                          description="Тестовая группа")
+        self.post = Post.objects.create(author=self.user, group=self.group,
+                                        text="Первая запись")
+
+    def test_feeds_list_posts(self):
+        urls = [reverse("feed_rss"), reverse("feed_atom"),
+                reverse("group_feed_rss", args=[self.group.slug]),
+                reverse("group_feed_atom", args=[self.group.slug]),
+                reverse("author_feed_rss", args=[self.user.username]),
+                reverse("author_feed_atom", args=[self.user.username])]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, "Первая запись")
+                self.assertIn("xml", response["Content-Type"])
+        response = self.client.get(reverse("group_feed_rss",
+                                           args=["nope"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_until_post_written(self):
+        url = reverse("group_feed_rss", args=[self.group.slug])
+        etag = self.client.get(url)["ETag"]
+        Post.objects.filter(pk=self.post.pk).update(text="Правка мимо")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, "Первая запись")
+        self.assertFalse(any("posts_post" in query["sql"]
+                             for query in queries))
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Post.objects.create(author=self.user, group=self.group,
+                            text="Вторая запись")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Вторая запись")
+
+
+@override_settings(DEBUG=True)
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        page_cache_stats.reset()
+        self.user = User.objects.create_user(username="sarah")
+        self.post = Post.objects.create(author=self.user, text="пост")
+
+    def test_second_anonymous_request_skips_database(self):
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("index"))
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.assertContains(response, "пост")
+        response = self.client.get(reverse("index"),
+                                   HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(page_cache_stats.snapshot()["index"],
+                         {"hit": 2, "miss": 1, "bypass": 0})
+
+    def test_writes_purge_affected_pages(self):
+        post_url = reverse("post", args=[self.user.username, self.post.pk])
+        profile_url = reverse("profile", args=[self.user.username])
+        self.client.get(post_url)
+        self.client.get(profile_url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text="свежий комментарий")
+        response = self.client.get(post_url)
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "свежий комментарий")
+        self.assertEqual(self.client.get(profile_url)["X-Page-Cache"],
+                         "MISS")
+        self.assertEqual(self.client.get(profile_url)["X-Page-Cache"], "HIT")
+        Follow.objects.create(
+            user=User.objects.create_user(username="reader"),
+            author=self.user)
+        self.assertEqual(self.client.get(profile_url)["X-Page-Cache"],
+                         "MISS")
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("index"))
+        self.assertNotIn("X-Page-Cache", response)
+        self.assertEqual(page_cache_stats.snapshot(), {})
+
+
+def flaky_job(fail):
+    if fail:
+        raise RuntimeError("не вышло")
+
+
+class JobQueueTest(TestCase):
+    def test_job_runs_and_is_removed(self):
+        job = jobs.enqueue("posts.tests.flaky_job", {"fail": False})
+        self.assertEqual(jobs.claim(10), [job.pk])
+        self.assertEqual(jobs.claim(10), [])
+        self.assertTrue(jobs.run_job(job.pk))
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_retries_with_backoff(self):
+        job = jobs.enqueue("posts.tests.flaky_job", {"fail": True},
+                           max_attempts=2)
+        jobs.claim(10)
+        self.assertFalse(jobs.run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("не вышло", job.last_error)
+        self.assertGreater(job.run_at, job.created)
+        self.assertEqual(jobs.claim(10), [])
+        Job.objects.update(run_at=job.created)
+        jobs.claim(10)
+        jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    @override_settings(
+        EMAIL_BACKEND="posts.mail.QueuedEmailBackend",
+        QUEUED_EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_email_is_sent_by_worker(self):
+        from django.core import mail
+
+        mail.send_mail("Тема", "Текст", "from@yatube.ru", ["to@yatube.ru"])
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Job.objects.count(), 1)
+        call_command("run_worker", "--once", "--processes", "0",
+                     stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Тема")
+        self.assertFalse(Job.objects.exists())
+
+    def test_missing_job_counts_as_done(self):
+        job = jobs.enqueue("posts.tests.flaky_job", {"fail": False})
+        jobs.claim(10)
+        Job.objects.all().delete()
+        self.assertTrue(jobs.run_job(job.pk))
+
+    @override_settings(DATABASE_REPLICAS=["replica"])
+    def test_worker_reads_from_primary(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        reads = []
+        job = jobs.enqueue("posts.tests.flaky_job", {"fail": False})
+        # Реплики "replica" в DATABASES нет: чтение с неё упало бы.
+        with mock.patch.object(jobs, "import_string", return_value=(
+                lambda fail: reads.append(
+                    routers.ReplicaRouter().db_for_read(Job)))):
+            routers.reset()
+            self.assertEqual(jobs.claim(10), [job.pk])
+            routers.reset()
+            self.assertTrue(jobs.run_job(job.pk))
+        self.assertEqual(reads, ["default"])
+
+    def test_thumbnails_are_queued_once(self):
+        user = User.objects.create_user(username="sarah")
+        post = Post.objects.create(author=user, text="с картинкой")
+        thumbnails.enqueue(post)
+        thumbnails.enqueue(post)
+        job = Job.objects.get()
+        self.assertEqual((job.name, json.loads(job.payload)),
+                         (thumbnails.GENERATE_JOB, {"post_id": post.pk}))
+
+    def test_dedup_key_allows_one_queued_copy(self):
+        job = jobs.enqueue("posts.tests.flaky_job", {"fail": True},
+                           dedup_key="flaky")
+        self.assertIsNone(jobs.enqueue("posts.tests.flaky_job",
+                                       {"fail": True}, dedup_key="flaky"))
+        jobs.claim(10)
+        # Пока задача выполняется, в очередь встаёт её замена; упавшая
+        # задача тогда не возвращается в очередь второй копией.
+        fresh = jobs.enqueue("posts.tests.flaky_job", {"fail": True},
+                             dedup_key="flaky")
+        self.assertFalse(jobs.run_job(job.pk))
+        self.assertEqual(list(Job.objects.values_list("pk", flat=True)),
+                         [fresh.pk])
+
+
+class SamplingProfilerTest(TestCase):
+    def test_disabled_without_sample_rates(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            SamplingProfilerMiddleware(lambda request: None)
+
+    def test_sampled_views_are_merged(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        user = User.objects.create_user(username="sarah")
+        for i in range(20):
+            Post.objects.create(author=user, text=f"пост {i}")
+        client = Client()
+        client.force_login(user)
+        with override_settings(PROFILER_SAMPLE_RATES={"index": 1.0},
+                               PROFILER_INTERVAL=0.0001,
+                               PROFILER_DIR=directory.name):
+            for _ in range(5):
+                client.get(reverse("index"))
+            client.get(reverse("profile", args=[user.username]))
+            out = io.StringIO()
+            call_command("merge_profiles", stdout=out)
+        self.assertEqual(sorted(os.listdir(directory.name)),
+                         ["index", "index.folded"])
+        self.assertIn("== index:", out.getvalue())
+        with open(os.path.join(directory.name, "index.folded")) as folded:
+            self.assertIn("index (posts/views.py:", folded.read())
+
+
+class SeedDataTest(TestCase):
+    def test_seed_is_consistent_and_benchmarkable(self):
+        call_command("seed_data", "--users", "30", "--groups", "3",
+                     "--posts", "200", "--follows", "4", "--image-ratio", "0",
+                     "--burst-ratio", "0.05", "--burst-size", "60",
+                     stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        post = Post.objects.order_by("-comment_count").first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        self.assertGreater(post.comment_count, 30)
+        follow = Follow.objects.select_related("author__stats").filter(
+            author__stats__followers__lte=timeline.FANOUT_LIMIT).first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user,
+                                         post__author=follow.author).count(),
+            follow.author.posts.count())
+        # Следующие записи и пользователи получают id после сгенерированных.
+        user = User.objects.create_user(username="after_seed")
+        Post.objects.create(author=user, text="после генерации")
+
+
+class BenchmarkReportTest(TransactionTestCase):
+    # Прогон идёт из потоков, которым нужны закоммиченные данные.
+    def test_runs_are_appended_to_report(self):
+        call_command("seed_data", "--users", "10", "--groups", "2",
+                     "--posts", "20", "--image-ratio", "0",
+                     stdout=io.StringIO())
+        report = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+        report.close()
+        self.addCleanup(os.remove, report.name)
+        out = io.StringIO()
+        call_command("benchmark_views", "--requests", "2", "--concurrency",
+                     "1", "--report", report.name, stdout=out)
+        call_command("benchmark_views", "--requests", "2", "--concurrency",
+                     "2", "--report", report.name, "--label", "второй",
+                     stdout=out)
+        self.assertIn("p99", out.getvalue())
+        with open(report.name) as lines:
+            runs = [json.loads(line) for line in lines]
+        self.assertEqual([run["label"] for run in runs], ["", "второй"])
+        run = runs[0]
+        self.assertEqual(run["sizes"]["posts"], 20)
+        self.assertEqual({result["errors"] for result in run["results"]}, {0})
+
+
+class QueryPlanTest(TestCase):
+    def explain(self, queryset):
+        recorder = StatementRecorder()
+        with connection.execute_wrapper(recorder):
+            list(queryset)
+        return analyze(recorder.statements[0])
+
+    def test_sort_without_index_gets_suggestion(self):
+        user = User.objects.create_user(username="sarah")
+        finding = self.explain(
+            Comment.objects.filter(author=user).order_by("-created"))
+        self.assertIn("сортировка во временном B-дереве", finding.problems)
+        self.assertEqual(finding.suggestions,
+                         [(Comment, ["author", "-created"])])
+
+    def test_feed_queries_use_indexes(self):
+        user = User.objects.create_user(username="sarah")
+        group = Group.objects.create(title="t", slug="t", description="d")
+        post = Post.objects.create(author=user, group=group, text="пост")
+        for queryset in (user.posts.all()[:10], group.posts.all()[:10],
+                         post.comments.all()[:10]):
+            finding = self.explain(queryset)
+            self.assertEqual(finding.problems, [], finding.plan)
+
+    def test_explain_views_finds_nothing_missing(self):
+        call_command("seed_data", "--users", "20", "--posts", "100",
+                     "--image-ratio", "0", stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("explain_views", stdout=out)
+        self.assertIn("post_comments", out.getvalue())
+        self.assertIn("Недостающих индексов не найдено", out.getvalue())
+
+
+@override_settings(CACHES=CACHE)
+class RecommendationTest(TestCase):
+    def setUp(self):
+        names = ["sarah", "bob", "carl", "dina", "emma", "fred", "xena"]
+        self.users = {name: User.objects.create_user(username=name)
+                      for name in names}
+        for user, authors in [("sarah", ["bob", "carl"]),
+                              ("bob", ["dina"]),
+                              ("carl", ["dina", "emma"]),
+                              ("xena", ["bob", "carl", "fred"])]:
+            for author in authors:
+                Follow.objects.create(user=self.users[user],
+                                      author=self.users[author])
+        recommendations.build_all()
+
+    def recommended(self, name):
+        return list(Recommendation.objects.filter(
+            user=self.users[name]).values_list("author__username", "mutual"))
+
+    def test_friends_of_friends_and_co_followers(self):
+        self.assertEqual(self.recommended("sarah"),
+                         [("dina", 2), ("emma", 1), ("fred", 0)])
+        self.assertEqual(recommendations.build_all(), 0)
+
+    def test_follow_refreshes_incrementally(self):
+        client = Client()
+        client.force_login(self.users["sarah"])
+        client.get(reverse("profile_follow", args=["dina"]))
+        client.get(reverse("profile_follow", args=["emma"]))
+        self.assertEqual(Job.objects.filter(
+            name=recommendations.REFRESH_JOB).count(), 1)
+        stale = set(UserStats.objects.filter(
+            recommendations_stale=True).values_list(
+            "user__username", flat=True))
+        self.assertEqual(stale, {"sarah"})
+        response = client.get(reverse("follow_index"))
+        self.assertContains(response, "Кого почитать")
+        self.assertNotContains(response, "/dina/")
+        self.assertEqual(recommendations.refresh_stale(), 1)
+        self.assertEqual(self.recommended("sarah"), [("fred", 0)])
+
+    def test_shown_only_on_own_profile(self):
+        client = Client()
+        client.force_login(self.users["sarah"])
+        response = client.get(reverse("profile", args=["sarah"]))
+        self.assertContains(response, "Кого почитать")
+        response = client.get(reverse("profile", args=["bob"]))
+        self.assertNotContains(response, "Кого почитать")
+
+    @skipUnless(recommendations.sparse, "нужны numpy и scipy")
+    def test_sparse_scores_match_python(self):
+        graph = recommendations.FollowGraph.load()
+        user_ids = [user.pk for user in self.users.values()]
+        expected = {user_id: recommendations.top(graph, user_id, *scores)
+                    for user_id, *scores in recommendations.score_python(
+                        graph, user_ids)}
+        actual = {user_id: recommendations.top(graph, user_id, *scores)
+                  for user_id, *scores in recommendations.score_sparse(
+                      graph, user_ids)}
+        self.assertEqual(actual, expected)
+
+
+@override_settings(CACHES=CACHE)
+class TrendingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="sarah")
+        self.client_login = Client()
+        self.client_login.force_login(self.user)
+        self.old = Post.objects.create(author=self.user, text="старый")
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=self.old.pub_date - timedelta(days=2))
+        trending.rebuild()
+        self.new = Post.objects.create(author=self.user, text="новый")
+
+    def scores(self):
+        return dict(Post.objects.values_list("pk", "trending_score"))
+
+    def test_comments_lift_older_post(self):
+        response = self.client_login.get(reverse("trending"))
+        self.assertEqual(list(response.context["page"]),
+                         [self.new, self.old])
+        for _ in range(3):
+            self.client_login.post(
+                reverse("add_comment", args=["sarah", self.old.pk]),
+                {"text": "обсуждаем"})
+        response = self.client_login.get(reverse("trending"))
+        self.assertEqual(list(response.context["page"]),
+                         [self.old, self.new])
+
+    def test_incremental_scores_match_rebuild(self):
+        comments = [Comment.objects.create(post=self.old, author=self.user,
+                                           text=str(i)) for i in range(3)]
+        comments[0].delete()
+        incremental = self.scores()
+        trending.rebuild()
+        for pk, score in self.scores().items():
+            self.assertAlmostEqual(incremental[pk], score, places=6)
+
+    def test_deleting_post_skips_comment_bookkeeping(self):
+        for i in range(5):
+            Comment.objects.create(post=self.old, author=self.user,
+                                   text=str(i))
+        with CaptureQueriesContext(connection) as queries:
+            self.old.delete()
+        self.assertFalse(any(query["sql"].startswith('UPDATE "posts_post"')
+                             for query in queries))
+        self.assertFalse(Comment.objects.exists())
+
+    def test_rebuild_in_batches_matches_single_pass(self):
+        for post in (self.old, self.new):
+            Comment.objects.create(post=post, author=self.user, text="к")
+        trending.rebuild()
+        expected = self.scores()
+        Post.objects.update(trending_score=0)
+        self.assertEqual(trending.rebuild(batch_size=1), 2)
+        self.assertEqual(self.scores(), expected)
+
+    def test_deleting_late_comment_restores_post_score(self):
+        for days in (10, 14, 30):
+            comment = Comment.objects.create(post=self.old, author=self.user,
+                                             text="поздний")
+            Comment.objects.filter(pk=comment.pk).update(
+                created=self.old.pub_date + timedelta(days=days))
+            trending.rebuild()
+            Comment.objects.get(pk=comment.pk).delete()
+            self.old.refresh_from_db()
+            self.assertAlmostEqual(self.old.trending_score,
+                                   trending.post_score(self.old), places=6)
+
+    def test_combine_adds_weights(self):
+        self.assertAlmostEqual(trending.combine(3.0, 3.0), 4.0)
+        self.assertAlmostEqual(trending.combine(10.0, 0.0),
+                               math.log2(2 ** 10 + 1))
@@ -0,0 +1,98 @@
+"""Фоновая подготовка миниатюр для карточек записей.
+
+Миниатюры всех размеров карточек и адаптивные варианты картинки (несколько
+ширин в JPEG и WebP) строит задача очереди (posts.jobs), поставленная
+вместе с сохранением записи. Шаблон только читает готовые файлы
+и показывает заглушку, пока они не построены.
+"""
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
+
+from . import feed_cache, jobs
+from .models import Post, PostImageVariant
+
+GENERATE_JOB = "posts.thumbnails.generate"
+CARD_SIZES = {
+    "960x339": {"crop": "center", "upscale": True},
+}
+VARIANT_WIDTHS = (320, 640, 960)
+VARIANT_FORMATS = ("WEBP", "JPEG")
+CARD_RATIO = 339 / 960
+
+
+class _ThumbnailName(Exception):
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+class NamingBackend(ThumbnailBackend):
+    """Проходит get_thumbnail до имени файла миниатюры и останавливается.
+
+    Опции по умолчанию при этом заполняет сам sorl, поэтому имя то же,
+    что у миниатюры, построенной обычным get_thumbnail.
+    """
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        raise _ThumbnailName(super()._get_thumbnail_filename(
+            source, geometry_string, options))
+
+
+_naming_backend = NamingBackend()
+
+
+class CardThumbnailBackend(ThumbnailBackend):
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None; сама миниатюра не строится."""
+        try:
+            _naming_backend.get_thumbnail(file_, geometry_string, **options)
+        except _ThumbnailName as thumbnail:
+            return default.kvstore.get(
+                ImageFile(thumbnail.name, default.storage))
+
+
+backend = CardThumbnailBackend()
+
+
+def cached_card_thumbnail(image, geometry):
+    if not image:
+        return None
+    return backend.get_cached_thumbnail(image, geometry,
+                                        **CARD_SIZES[geometry])
+
+
+def build_variants(post):
+    variants = []
+    for width in VARIANT_WIDTHS:
+        height = round(width * CARD_RATIO)
+        for format_ in VARIANT_FORMATS:
+            thumbnail = backend.get_thumbnail(
+                post.image, f"{width}x{height}", crop="center", upscale=True,
+                format=format_)
+            variants.append(PostImageVariant(
+                post=post, width=width, height=height, format=format_,
+                image=thumbnail.name))
+    with transaction.atomic():
+        post.image_variants.all().delete()
+        PostImageVariant.objects.bulk_create(variants)
+
+
+def generate(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    if not post.image:
+        post.image_variants.all().delete()
+        return
+    for geometry, options in CARD_SIZES.items():
+        backend.get_thumbnail(post.image, geometry, **options)
+    build_variants(post)
+    feed_cache.invalidate_post(post)
+
+
+def enqueue(post):
+    """Ставит построение миниатюр в очередь задач, если его там ещё нет."""
+    return jobs.enqueue(GENERATE_JOB, {"post_id": post.pk},
+                        dedup_key=f"{GENERATE_JOB}:{post.pk}")
@@ -0,0 +1,258 @@
+"""Материализованная лента подписок.
+
+Новая запись раскладывается по лентам подписчиков автора при сохранении
+(fan-out on write), поэтому страница /follow/ — один диапазон по индексу
+(user, pub_date, post) самой TimelineEntry. Записи авторов с огромным
+числом подписчиков не раскладываются: читатель добирает их сам (pull),
+и Timeline сливает оба источника по ключу (pub_date, id). Когда автор
+переходит FANOUT_LIMIT, его записи убираются из лент подписчиков, а когда
+опускается обратно — раскладываются заново, как при подписке.
+
+Лента хранит не больше TIMELINE_LENGTH последних записей: лишнее
+срезается при раскладке, каждый раз у доли TRIM_EVERY подписчиков,
+чтобы стоимость обрезки делилась между записями.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .paginators import CursorPaginator
+
+FANOUT_LIMIT = getattr(settings, "TIMELINE_FANOUT_LIMIT", 5000)
+BACKFILL_SIZE = getattr(settings, "TIMELINE_BACKFILL_SIZE", 200)
+TIMELINE_LENGTH = getattr(settings, "TIMELINE_LENGTH", 1000)
+TRIM_EVERY = getattr(settings, "TIMELINE_TRIM_EVERY", 50)
+BATCH_SIZE = 1000
+PULL_AUTHORS_TIMEOUT = 60
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(user_id=author_id,
+                                    followers__gt=FANOUT_LIMIT).exists()
+
+
+def _followers(author_id):
+    return UserStats.objects.filter(user_id=author_id).values_list(
+        "followers", flat=True).first() or 0
+
+
+def _forget_pull_authors(author_id):
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True)
+    cache.delete_many([f"timeline:pull_authors:{user_id}"
+                       for user_id in follower_ids.iterator()])
+
+
+def pull_author_ids(user):
+    """Авторы из подписок пользователя, чьи записи не раскладываются."""
+    key = f"timeline:pull_authors:{user.pk}"
+    author_ids = cache.get(key)
+    if author_ids is None:
+        followed = Follow.objects.filter(user=user).values("author")
+        author_ids = list(UserStats.objects.filter(
+            user__in=followed, followers__gt=FANOUT_LIMIT).values_list(
+            "user", flat=True))
+        cache.set(key, author_ids, PULL_AUTHORS_TIMEOUT)
+    return author_ids
+
+
+def fan_out_post(post):
+    if is_pull_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(author_id=post.author_id).values_list(
+        "user_id", flat=True)
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(TimelineEntry(user_id=user_id, post=post,
+                                   pub_date=post.pub_date))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    cap_follower_timelines(post.author_id, post.pk)
+
+
+def stop_fan_out(author_id):
+    """Автор стал pull-автором: его записи уходят из лент подписчиков."""
+    TimelineEntry.objects.filter(post__author_id=author_id).delete()
+    _forget_pull_authors(author_id)
+
+
+def resume_fan_out(author_id):
+    """Автор снова раскладывается: подписчики получают его последние
+    записи, как при подписке."""
+    recent = list(Post.objects.filter(author_id=author_id).values_list(
+        "id", "pub_date")[:BACKFILL_SIZE])
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True)
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.extend(TimelineEntry(user_id=user_id, post_id=post_id,
+                                   pub_date=pub_date)
+                     for post_id, pub_date in recent)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    _forget_pull_authors(author_id)
+    follow = Follow._meta.db_table
+    _cap(f"user_id IN (SELECT user_id FROM {follow} WHERE author_id = %s)",
+         [author_id])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту записи нового автора из подписок.
+
+    Вызывается после обновления счётчика подписчиков: если подписка
+    перевела автора за FANOUT_LIMIT, его записи убираются из всех лент.
+    """
+    cache.delete(f"timeline:pull_authors:{user_id}")
+    followers = _followers(author_id)
+    if followers > FANOUT_LIMIT:
+        if followers == FANOUT_LIMIT + 1:
+            stop_fan_out(author_id)
+        return
+    recent = Post.objects.filter(author_id=author_id).values_list(
+        "id", "pub_date")[:BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in recent],
+        ignore_conflicts=True)
+    cap_timeline(user_id)
+
+
+def fan_out_since(post_id, follow_id):
+    """Раскладывает одним INSERT ... SELECT записи после массовой загрузки.
+
+    В ленты попадают пары (подписка, запись), где запись новее
+    ``post_id`` или подписка новее ``follow_id``; пары старых подписок
+    и старых записей уже разложены. Как и fan_out_post, пропускает
+    pull-авторов, поэтому UserStats должны быть пересчитаны.
+    """
+    entry = TimelineEntry._meta.db_table
+    follow = Follow._meta.db_table
+    post = Post._meta.db_table
+    stats = UserStats._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {entry} (user_id, post_id, pub_date) "
+            f"SELECT f.user_id, p.id, p.pub_date FROM {post} p "
+            f"JOIN {follow} f ON f.author_id = p.author_id "
+            f"WHERE (p.id > %s OR f.id > %s) AND p.author_id NOT IN ("
+            f"SELECT user_id FROM {stats} WHERE followers > %s)",
+            [post_id, follow_id, FANOUT_LIMIT])
+        return cursor.rowcount
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты записи автора после отписки.
+
+    Вызывается после обновления счётчика подписчиков: если автор
+    опустился до FANOUT_LIMIT, его записи снова раскладываются.
+    """
+    cache.delete(f"timeline:pull_authors:{user_id}")
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id=author_id).delete()
+    if _followers(author_id) == FANOUT_LIMIT:
+        resume_fan_out(author_id)
+
+
+def _cap(where, params):
+    """Удаляет записи лент дальше TIMELINE_LENGTH-й по (pub_date, post)."""
+    table = TimelineEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM (SELECT id, ROW_NUMBER() OVER ("
+            f"PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC"
+            f") AS position FROM {table} WHERE {where}) "
+            f"WHERE position > %s)", [*params, TIMELINE_LENGTH])
+        return cursor.rowcount
+
+
+def cap_timeline(user_id):
+    return _cap("user_id = %s", [user_id])
+
+
+def cap_follower_timelines(author_id, post_id):
+    """Обрезает ленты части подписчиков: каждого — раз в TRIM_EVERY."""
+    follow = Follow._meta.db_table
+    return _cap(f"user_id IN (SELECT user_id FROM {follow} "
+                f"WHERE author_id = %s AND (user_id + %s) %% %s = 0)",
+                [author_id, post_id, TRIM_EVERY])
+
+
+def cap_all_timelines():
+    return _cap("1 = 1", [])
+
+
+class Timeline:
+    """Лента подписок: TimelineEntry читателя и записи pull-авторов.
+
+    Отдаёт записи по убыванию (pub_date, id). Годится и для Paginator
+    (count() и срезы), и для TimelineCursorPaginator.
+    """
+
+    def __init__(self, user, author_ids=None):
+        self.user = user
+        if author_ids is None:
+            author_ids = pull_author_ids(user)
+        self.author_ids = author_ids
+
+    def _sources(self):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        yield entries, "pub_date", "post_id"
+        if self.author_ids:
+            yield (Post.objects.filter(author__in=self.author_ids),
+                   "pub_date", "id")
+
+    def count(self):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        if not self.author_ids:
+            return entries.count()
+        # Записи, разложенные до перехода автора в pull, могут остаться
+        # и в ленте; _keys их схлопывает, здесь они не считаются дважды.
+        return (entries.exclude(post__author__in=self.author_ids).count()
+                + Post.objects.filter(author__in=self.author_ids).count())
+
+    def _keys(self, date, pk, limit, newer=False):
+        keys = set()
+        for rows, date_field, id_field in self._sources():
+            if date is not None:
+                compare = "gt" if newer else "lt"
+                rows = rows.filter(
+                    Q(**{f"{date_field}__{compare}": date})
+                    | Q(**{date_field: date, f"{id_field}__{compare}": pk}))
+            order = ("" if newer else "-")
+            keys.update(rows.order_by(
+                order + date_field, order + id_field).values_list(
+                date_field, id_field)[:limit])
+        return sorted(keys, reverse=not newer)[:limit]
+
+    def _posts(self, keys):
+        posts = Post.objects.for_cards().in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def older(self, date, pk, limit):
+        return self._posts(self._keys(date, pk, limit))
+
+    def newer(self, date, pk, limit):
+        return self._posts(self._keys(date, pk, limit, newer=True))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        keys = self._keys(None, None, index.stop)
+        return self._posts(keys[index.start or 0:index.stop])
+
+
+class TimelineCursorPaginator(CursorPaginator):
+    """CursorPaginator, листающий Timeline по (pub_date, id)."""
+
+    def _older(self, date, pk, limit):
+        return self.object_list.older(date, pk, limit)
+
+    def _newer(self, date, pk, limit):
+        return self.object_list.newer(date, pk, limit)
@@ -0,0 +1,114 @@
+"""Тренды: записи по затухающей со временем активности обсуждения.
+
+Событие (публикация или комментарий) в момент t весит
+``weight · 2^((t − EPOCH) / HALF_LIFE)``: спустя HALF_LIFE любое новое
+событие весит вдвое больше. Оценка записи — сумма весов её событий.
+Затухание одинаково для всех записей, поэтому их порядок со временем
+не меняется и хранимую оценку не нужно пересчитывать: новый комментарий
+лишь прибавляет свой вес одним UPDATE, а лента трендов — обычная
+выборка по индексу Post.trending_score. Удаление комментария так же
+вычитает его вес; если же комментарий составлял почти всю оценку,
+разность теряет точность, и запись пересчитывается по её оставшимся
+событиям (rescore).
+
+Чтобы веса не переполнялись, хранится логарифм суммы по основанию 2,
+а сложение идёт как max(a, b) + log2(1 + 2^−|a − b|).
+"""
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from .models import Comment, Post
+
+HALF_LIFE = getattr(settings, "TRENDING_HALF_LIFE", 6 * 60 * 60)
+POST_WEIGHT = 1.0
+COMMENT_WEIGHT = 1.0
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Вычитать событие можно, пока после него остаётся хотя бы 2^−20 суммы:
+# дальше от остатка останется лишь ошибка округления.
+MIN_GAP = -math.log2(1 - 2 ** -20)
+
+
+def event_score(moment, weight):
+    """Логарифм веса события в момент ``moment``."""
+    return ((moment - EPOCH).total_seconds() / HALF_LIFE
+            + math.log2(weight))
+
+
+def combine(first, second):
+    """Оценка суммы двух событий по их оценкам."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def added(score, field="trending_score"):
+    """Выражение для UPDATE: к оценке в ``field`` прибавить событие."""
+    value = Value(score, output_field=FloatField())
+    return ExpressionWrapper(
+        Greatest(F(field), value) + Log(
+            Value(2.0), Value(1.0) + Power(
+                Value(2.0), -Abs(F(field) - value))),
+        output_field=FloatField())
+
+
+def removed(score, field="trending_score"):
+    """Выражение для UPDATE: из оценки в ``field`` вычесть событие.
+
+    Верно, только если оценка больше ``score`` хотя бы на MIN_GAP.
+    """
+    value = Value(score, output_field=FloatField())
+    return ExpressionWrapper(
+        F(field) + Log(
+            Value(2.0), Value(1.0) - Power(Value(2.0), value - F(field))),
+        output_field=FloatField())
+
+
+def post_score(post):
+    return event_score(post.pub_date or timezone.now(), POST_WEIGHT)
+
+
+def rebuild(post_ids=None, batch_size=500):
+    """Пересчитывает оценки записей (всех или ``post_ids``) по комментариям.
+
+    Записи идут порциями по первичному ключу, комментарии порции читаются
+    потоком: в памяти держатся оценки только одной порции.
+    """
+    posts = Post.objects.order_by("pk")
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+    total = last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk).values_list(
+            "pk", "pub_date")[:batch_size])
+        if not batch:
+            return total
+        last_pk = batch[-1][0]
+        scores = {pk: event_score(pub_date, POST_WEIGHT)
+                  for pk, pub_date in batch}
+        comments = Comment.objects.filter(post_id__in=scores).values_list(
+            "post_id", "created")
+        for post_id, created in comments.iterator():
+            scores[post_id] = combine(scores[post_id],
+                                      event_score(created, COMMENT_WEIGHT))
+        Post.objects.bulk_update(
+            [Post(pk=pk, trending_score=score)
+             for pk, score in scores.items()], ["trending_score"])
+        total += len(batch)
+
+
+def rescore(post_id):
+    """Пересчитывает оценку одной записи, например после удаления."""
+    return rebuild(post_ids=[post_id])
+
+
+def remove(post_id, moment, weight=COMMENT_WEIGHT):
+    """Вычитает из оценки записи событие в момент ``moment``."""
+    score = event_score(moment, weight)
+    if not Post.objects.filter(
+            pk=post_id, trending_score__gt=score + MIN_GAP).update(
+                trending_score=removed(score)):
+        rescore(post_id)
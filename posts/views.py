@@ -1,29 +1,63 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import render, get_object_or_404, redirect
 
-from . import forms
-from .models import Post, Group, User, Follow
+from . import forms, recommendations, thumbnails
+from .conditional import (conditional_page, group_scopes, index_scopes,
+                          post_scopes, profile_scopes)
+from .feed_cache import (INDEX, feed_cache_context, follow_scopes,
+                         group_scope, profile_scope)
+from .models import Post, Group, User, Follow, Comment
+from .paginators import (COMMENTS_PER_PAGE, POSTS_PER_PAGE,
+                         CursorPage, CursorPaginator, paginate)
+from .search import search_posts
+from .stats import get_stats
+from .timeline import Timeline, TimelineCursorPaginator
 
 
+@conditional_page(index_scopes)
 def index(request):
-    post_list = Post.objects.all().select_related("group")
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_cards()
+    page, paginator = paginate(request, post_list)
 
     return render(request, "index.html",
-                  {"page": page, "paginator": paginator})
+                  {"page": page, "paginator": paginator,
+                   **feed_cache_context(request, page, INDEX)})
 
 
+@conditional_page(index_scopes)
+def trending(request):
+    """Записи по затухающей активности обсуждения (см. posts.trending).
+
+    Оценка хранится в индексированном столбце, поэтому страница стоит
+    столько же, сколько хронологическая лента.
+    """
+    post_list = Post.objects.for_cards().order_by("-trending_score", "-id")
+    paginator = Paginator(post_list, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "trending.html",
+                  {"page": page, "paginator": paginator,
+                   **feed_cache_context(request, page, INDEX)})
+
+
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_post_list = group.posts.all()
-    paginator = Paginator(group_post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    return render(request, "group.html", {"group": group, "page": page,
-                                          "paginator": paginator})
+    group_post_list = group.posts.for_cards()
+    page, paginator = paginate(request, group_post_list)
+    return render(request, "group.html", {
+        "group": group, "page": page, "paginator": paginator,
+        **feed_cache_context(request, page, group_scope(group.pk))})
+
+
+def search(request):
+    query = request.GET.get("q", "").strip()
+    post_list = search_posts(query).for_cards()
+    paginator = Paginator(post_list, POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "search.html", {"query": query, "page": page,
+                                           "paginator": paginator})
 
 
 @login_required
@@ -34,37 +68,89 @@ def new_post(request):
             new = form.save(commit=False)
             new.author = request.user
             new.save()
+            if new.image:
+                thumbnails.enqueue(new)
             return redirect('index')
         return render(request, 'new.html', {'form': form})
     form = forms.PostForm()
     return render(request, 'new.html', {'form': form})
 
 
+@conditional_page(profile_scopes)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    user_post_list = user.posts.all()
-    paginator = Paginator(user_post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    user_post_list = user.posts.for_cards()
+    page, paginator = paginate(request, user_post_list)
     can_follow = request.user.is_authenticated and request.user != user
     following = can_follow and Follow.objects.filter(
         user=request.user, author=user).exists()
+    stats = get_stats(user)
+    is_owner = request.user == user
     return render(request, 'profile.html', {'post_author': user, 'page': page,
                                             'paginator': paginator,
-                                            'post_count': paginator.count,
+                                            'stats': stats,
+                                            'post_count': stats.posts,
                                             "following": following,
-                                            "can_follow": can_follow})
+                                            "can_follow": can_follow,
+                                            "is_owner": is_owner,
+                                            "recommendations": (
+                                                recommendations.for_user(user)
+                                                if is_owner else []),
+                                            **feed_cache_context(
+                                                request, page,
+                                                profile_scope(user.pk))})
 
 
+@conditional_page(post_scopes)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
-    post_count = post.author.posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.select_related("author", "group"),
+                             id=post_id, author__username=username)
+    stats = get_stats(post.author)
+    page = comment_page(request, comments_for_list(post.pk),
+                        post.comment_count)
     form = forms.CommentForm(request.POST or None)
     return render(request, 'post.html',
-                  {'post': post, 'post_author': post.author,
-                   'post_count': post_count, 'comments': comments,
-                   'form': form})
+                  {'post': post, 'post_author': post.author, 'stats': stats,
+                   'post_count': stats.posts, 'comments': page.object_list,
+                   'comment_page': page, 'username': username,
+                   'post_id': post.pk, 'form': form})
+
+
+def comments_for_list(post_id):
+    """Комментарии записи с именем автора, без лишних столбцов."""
+    return Comment.objects.filter(post_id=post_id).select_related(
+        "author").only("id", "post_id", "text", "created", "author__username")
+
+
+def comment_page(request, comment_list, comment_count=None):
+    """Страница комментариев по курсору на дате создания.
+
+    Весь список ``comment_list`` в шаблон не попадает: берётся одна
+    порция, остальное подгружается через post_comments. Для первой
+    порции хватает счётчика ``comment_count`` записи: она остаётся
+    QuerySet ровно из COMMENTS_PER_PAGE строк, без лишней строки для
+    has_next.
+    """
+    cursor = request.GET.get("cursor")
+    if not cursor and comment_count is not None:
+        return CursorPage(
+            comment_list.order_by("-created", "-id")[:COMMENTS_PER_PAGE],
+            has_next=comment_count > COMMENTS_PER_PAGE, has_previous=False,
+            date_field="created")
+    paginator = CursorPaginator(comment_list, COMMENTS_PER_PAGE,
+                                date_field="created")
+    return paginator.get_page(cursor)
+
+
+@conditional_page(post_scopes)
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев для подгрузки на странице записи."""
+    get_object_or_404(Post.objects.only("id"), id=post_id,
+                      author__username=username)
+    page = comment_page(request, comments_for_list(post_id))
+    return render(request, "includes/comment_list.html",
+                  {"comments": page.object_list, "comment_page": page,
+                   "username": username, "post_id": post_id})
 
 
 @login_required
@@ -75,7 +161,12 @@ def post_edit(request, username, post_id):
     form = forms.PostForm(request.POST or None, files=request.FILES or None,
                           instance=post)
     if form.is_valid():
-        form.save()
+        # Только поля формы: счётчики, которые ведут сигналы, могли
+        # измениться, пока форма была открыта.
+        post = form.save(commit=False)
+        post.save(update_fields=form._meta.fields)
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(post)
         return redirect('post', username=username, post_id=post_id)
     return render(request, 'new.html',
                   {'form': form, 'username': username, 'post': post})
@@ -97,19 +188,22 @@ def add_comment(request, username, post_id):
         new = form.save(commit=False)
         new.author = request.user
         new.post = post
-        new.save()
+        with transaction.atomic():
+            new.save()
     return redirect('post', username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.select_related('author').filter(
-        author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    post_list = Timeline(request.user)
+    page, paginator = paginate(request, post_list,
+                               cursor_paginator=TimelineCursorPaginator)
     return render(request, "follow.html",
-                  {"page": page, "paginator": paginator})
+                  {"page": page, "paginator": paginator,
+                   "recommendations": recommendations.for_user(request.user),
+                   **feed_cache_context(
+                       request, page,
+                       *follow_scopes(request.user, post_list.author_ids))})
 
 
 @login_required
@@ -0,0 +1,16 @@
+"""Точки входа процессов run_worker.
+
+Процессы запускаются через spawn, чтобы не делить с родителем открытые
+соединения с БД, поэтому модуль не импортирует модели до django.setup().
+"""
+import django
+
+
+def setup():
+    django.setup()
+
+
+def run(job_id):
+    from .jobs import run_job
+
+    return run_job(job_id)
@@ -5,4 +5,8 @@ cp pytest.ini /app/pytest.ini
 cp -a tests/ /app/tests
 
 cd /app
+# Миниатюры, рекомендации и почту выполняет воркер очереди задач.
+python manage.py run_worker 1>&2 &
+worker=$!
+trap 'kill $worker 2>/dev/null' EXIT
 pytest --tb=line 1>&2
@@ -46,6 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.QueryStatsMiddleware',
+    'posts.routers.ReplicaPinMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
+    'posts.middleware.SamplingProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +90,23 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения, например
+# YATUBE_REPLICAS=replica1.sqlite3,replica2.sqlite3 (локально их
+# наполняет manage.py sync_replicas). В тестах реплики смотрят в default.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, name.strip()),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+# Сколько секунд после записи пользователь читает из основной базы.
+REPLICA_PIN_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -131,13 +152,39 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 
-EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# Письма уходят в очередь задач (manage.py run_worker), а отправляет
+# их QUEUED_EMAIL_BACKEND.
+EMAIL_BACKEND = "posts.mail.QueuedEmailBackend"
+QUEUED_EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# Один файл SQLite на сервер: кэш общий для всех воркеров gunicorn.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'posts.cache_backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
     }
-}
\ No newline at end of file
+}
+# Тесты подменяют кэш на свой (см. yatube.test_runner).
+TEST_RUNNER = 'yatube.test_runner.LocalCacheRunner'
+
+FEED_CACHE_TIMEOUT = 60 * 60
+API_CACHE_TIMEOUT = 60 * 60
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Доля профилируемых запросов по имени маршрута posts.urls, например
+# {"follow_index": 0.05}; пустой словарь — профилировщик выключен.
+PROFILER_SAMPLE_RATES = {}
+PROFILER_INTERVAL = 0.005
+PROFILER_DIR = os.path.join(BASE_DIR, "profiles")
+
+# Рекомендации «кого почитать» (manage.py build_recommendations); с
+# установленными numpy и scipy считаются разреженными матрицами.
+RECOMMENDATIONS_PER_USER = 10
+RECOMMENDATIONS_REFRESH_DELAY = 60
+
+# Через сколько секунд вес комментария в ленте трендов падает вдвое.
+TRENDING_HALF_LIFE = 6 * 60 * 60
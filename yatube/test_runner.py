@@ -0,0 +1,29 @@
+"""Кэш для тестов.
+
+Тесты (manage.py test и pytest, см. conftest.py) не должны читать
+и засорять кэш сервера разработки: у них свой кэш в памяти процесса.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+}
+
+
+def local_cache():
+    return override_settings(CACHES=TEST_CACHES)
+
+
+class LocalCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._local_cache = local_cache()
+        self._local_cache.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._local_cache.disable()
+        super().teardown_test_environment(**kwargs)
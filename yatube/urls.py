@@ -10,6 +10,8 @@ urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path('admin/', admin.site.urls),
     path('about/', include('django.contrib.flatpages.urls')),
+    path("api/", include("posts.api_urls")),
+    path("feeds/", include("posts.feed_urls")),
     path("", include("posts.urls"))
 ]
 